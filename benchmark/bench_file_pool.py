@@ -0,0 +1,51 @@
+"""
+LRU sink 池在大量不同日志文件下的吞吐和命中率
+
+    PYTHONPATH=. python benchmark/bench_file_pool.py [path_num] [record_num] [capacity]
+"""
+import sys
+import time
+import random
+import tempfile
+
+from unitlog.handlers import LogBox
+from unitlog.sink import SinkWorker, SinkPool
+from unitlog.unit import PoxyFileLogWriter
+
+
+def main():
+    path_num = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    record_num = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    capacity = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+
+    # 模拟租户日志: 少数热点租户 + 大量长尾租户
+    weights = [1 / (i + 1) for i in range(path_num)]
+    rng = random.Random(0)
+    keys = rng.choices(range(path_num), weights=weights, k=record_num)
+
+    pool = SinkPool(capacity=capacity)
+    msg = "x" * 100 + "\n"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.time()
+        for key in keys:
+            filepath = f"{tmp_dir}/tenant_{key}.log"
+
+            def factory(reopen):
+                return SinkWorker(PoxyFileLogWriter(filepath, file_mode="a"),
+                                  name=filepath).start()
+
+            pool.put(filepath, LogBox(log_msg=msg), factory)
+        dispatch_cost = time.time() - start
+        pool.close()
+        cost = time.time() - start
+
+    stats = pool.stats()
+    hit_rate = stats["hits"] / max(stats["hits"] + stats["misses"], 1)
+    print(f"paths={path_num} records={record_num} capacity={capacity}")
+    print(f"dispatch {record_num / dispatch_cost:.0f} records/s, "
+          f"end-to-end {record_num / cost:.0f} records/s")
+    print(f"hit_rate={hit_rate:.3f} {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+pre-fork 模式下 worker 数增加时的吞吐
+
+    PYTHONPATH=. python benchmark/bench_fork.py [record_num_per_worker]
+"""
+import os
+import sys
+import time
+
+from unitlog.unit import UnitLog
+
+WORKER_NUMS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def run(unit_log, logger, worker_num, record_num):
+    base_num = unit_log.written_num.value + unit_log.dropped_num.value
+    start = time.time()
+    pids = []
+    for worker_id in range(worker_num):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                for i in range(record_num):
+                    logger.info("bench %s %s %s", worker_id, i, "x" * 80)
+                unit_log.stop()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    produce_cost = time.time() - start
+    expect_num = base_num + worker_num * record_num
+    while (unit_log.written_num.value + unit_log.dropped_num.value
+           < expect_num):
+        time.sleep(0.001)
+    cost = time.time() - start
+    total = worker_num * record_num
+    print(f"workers={worker_num}: produce {total / produce_cost:.0f} "
+          f"records/s, end-to-end {total / cost:.0f} records/s, "
+          f"dropped {unit_log.dropped_num.value}")
+
+
+def main():
+    record_num = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    log_filepath = "./temp/bench_fork.log"
+    if os.path.exists(log_filepath):
+        os.remove(log_filepath)
+    unit_log = UnitLog()
+    logger = unit_log.register_logger(
+        name="bench_fork", console_log=False, file_log=True,
+        log_filepath=log_filepath)
+    # Log_filename 日志
+    while unit_log.written_num.value < 1:
+        time.sleep(0.001)
+    for worker_num in WORKER_NUMS:
+        run(unit_log, logger, worker_num, record_num)
+    unit_log.stop()
+
+
+if __name__ == "__main__":
+    main()
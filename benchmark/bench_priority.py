@@ -0,0 +1,90 @@
+"""
+ERROR 日志在 INFO 洪峰下的端到端投递延迟
+
+    PYTHONPATH=. python benchmark/bench_priority.py [flood_num]
+"""
+import os
+import sys
+import time
+import logging
+import threading
+
+from unitlog.unit import UnitLog
+
+LOG_FILEPATH = "./temp/bench_priority.log"
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def tail_probes(stop_event, latencies):
+    """ 读取日志文件中的探针行, 计算从打日志到落盘的耗时
+    """
+    while not os.path.exists(LOG_FILEPATH):
+        time.sleep(0.001)
+    with open(LOG_FILEPATH, "r") as fp:
+        while True:
+            line = fp.readline()
+            if not line:
+                if stop_event.is_set():
+                    break
+                time.sleep(0.001)
+                continue
+            if "probe" not in line:
+                continue
+            level, sent_at = line.split("probe ")[1].split()
+            latencies[level].append(time.time() - float(sent_at))
+
+
+def run(priority_level, flood_num):
+    if os.path.exists(LOG_FILEPATH):
+        os.remove(LOG_FILEPATH)
+    unit_log = UnitLog(priority_level=priority_level)
+    logger = unit_log.register_logger(
+        name=f"bench_priority_{priority_level}", console_log=False,
+        file_log=True, log_filepath=LOG_FILEPATH, file_log_mode="w")
+
+    latencies = {"INFO": [], "ERROR": []}
+    stop_event = threading.Event()
+    tailer = threading.Thread(target=tail_probes,
+                              args=(stop_event, latencies))
+    tailer.start()
+
+    for i in range(flood_num):
+        logger.info("flood %s", "x" * 100)
+        if i % 1000 == 0:
+            logger.info("probe INFO %s", time.time())
+            logger.error("probe ERROR %s", time.time())
+
+    deadline = time.time() + 60
+    expect_num = len(range(0, flood_num, 1000))
+    while (len(latencies["INFO"]) < expect_num
+           and time.time() < deadline):
+        time.sleep(0.01)
+    stop_event.set()
+    tailer.join()
+    unit_log.stopped.set()
+    unit_log.worker.join(timeout=5)
+
+    for level, values in latencies.items():
+        lane = ("off" if priority_level is None
+                else logging.getLevelName(priority_level))
+        print(f"priority_lane={lane} "
+              f"{level}: n={len(values)} "
+              f"p50={percentile(values, 0.5) * 1000:.2f}ms "
+              f"p99={percentile(values, 0.99) * 1000:.2f}ms "
+              f"max={max(values, default=float('nan')) * 1000:.2f}ms")
+
+
+def main():
+    flood_num = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    run(None, flood_num)
+    run(logging.ERROR, flood_num)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+process 模式与 thread 模式的吞吐对比
+
+    PYTHONPATH=. python benchmark/bench_writer_mode.py [record_num]
+"""
+import sys
+import time
+
+from unitlog.unit import UnitLog, MODE_PROCESS, MODE_THREAD
+
+
+def run(mode, record_num):
+    unit_log = UnitLog(mode=mode)
+    logger = unit_log.register_logger(
+        name=f"bench_writer_mode_{mode}", console_log=False, file_log=True,
+        log_filepath=f"./temp/bench_writer_mode_{mode}.log",
+        file_log_mode="w")
+    # Log_filename 日志
+    expect_num = record_num + 1
+    while unit_log.written_num.value < 1:
+        time.sleep(0.001)
+
+    start = time.time()
+    for i in range(record_num):
+        logger.info("bench %s %s", i, "x" * 80)
+    produce_cost = time.time() - start
+    # sink 队列满时会丢弃日志, 丢弃的也算处理完
+    while (unit_log.written_num.value + unit_log.dropped_num.value
+           < expect_num):
+        time.sleep(0.001)
+    cost = time.time() - start
+    unit_log.stop()
+
+    print(f"mode={mode}: produce {record_num / produce_cost:.0f} records/s "
+          f"({produce_cost / record_num * 1e6:.2f}us/record), "
+          f"end-to-end {record_num / cost:.0f} records/s, "
+          f"dropped {unit_log.dropped_num.value}")
+
+
+def main():
+    record_num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    run(MODE_PROCESS, record_num)
+    run(MODE_THREAD, record_num)
+
+
+if __name__ == "__main__":
+    main()
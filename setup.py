@@ -57,6 +57,7 @@ setup(
     description="",
     python_requires=">=3.6",
     install_requires=[],
+    extras_require={"columnar": ["numpy"]},
     url="https://github.com/yujun2647/unitlog",
     license='Apache-2.0',
     author="walkerjun",
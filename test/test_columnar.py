@@ -0,0 +1,80 @@
+import os
+import math
+import shutil
+import logging
+from unittest import TestCase, skipIf
+
+from unitlog.columnar import (PoxyColumnarLogWriter, iter_columnar_rows,
+                              load_columnar)
+from unitlog.unit import UnitLog
+from unitlog.util_log import time_cost_log_with_desc
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LOG_DIR = "./temp/test_columnar"
+
+
+class TestColumnar(TestCase):
+
+    def setUp(self):
+        shutil.rmtree(LOG_DIR, ignore_errors=True)
+        os.makedirs(LOG_DIR)
+        self.log_filepath = os.path.join(LOG_DIR, "cost.col")
+
+    def write_rows(self, num, file_mode="a"):
+        writer = PoxyColumnarLogWriter(self.log_filepath,
+                                       columns=("time_cost", "size"),
+                                       file_mode=file_mode)
+        for i in range(num):
+            writer.emit((1000.0 + i, logging.INFO, "app", f"func{i % 2}",
+                         (i * 1.5, float(i))))
+        writer.close()
+
+    def test_write_and_append(self):
+        self.write_rows(5000)
+        self.write_rows(10)
+        rows = list(iter_columnar_rows(self.log_filepath))
+        assert len(rows) == 5010
+        assert rows[3] == (1003.0, logging.INFO, "app", "func1",
+                           {"time_cost": 4.5, "size": 3.0})
+
+        self.write_rows(3, file_mode="w")
+        assert len(list(iter_columnar_rows(self.log_filepath))) == 3
+
+    def test_columns_mismatch(self):
+        self.write_rows(1)
+        with self.assertRaises(ValueError):
+            PoxyColumnarLogWriter(self.log_filepath, columns=("other", ))
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_load_columnar(self):
+        self.write_rows(100)
+        data = load_columnar(self.log_filepath)
+        assert data["time_cost"].shape == (100, )
+        assert data["time_cost"].sum() == sum(i * 1.5 for i in range(100))
+        assert list(data["funcs"][data["func_id"][:3]]) == \
+            ["func0", "func1", "func0"]
+
+    def test_log_func_cost(self):
+        unit_log = UnitLog()
+        logger = unit_log.register_logger(
+            name="test_columnar", console_log=False, columnar_log=True,
+            columnar_filepath=self.log_filepath)
+
+        @time_cost_log_with_desc(log_method=logger.info, min_cost=0)
+        def costly():
+            pass
+
+        for _ in range(3):
+            costly()
+        logger.info("no time cost")
+        unit_log.stopped.set()
+        unit_log.worker.join(timeout=5)
+
+        rows = list(iter_columnar_rows(self.log_filepath))
+        assert [row[3] for row in rows[:3]] == ["costly"] * 3
+        assert all(row[4]["time_cost"] >= 0 for row in rows[:3])
+        assert math.isnan(rows[3][4]["time_cost"])
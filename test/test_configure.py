@@ -0,0 +1,62 @@
+import os
+import logging
+from unittest import TestCase
+
+from unitlog.unit import UnitLog
+
+LOG_FILEPATH = "./temp/test_configure/app.log"
+
+
+class TestConfigure(TestCase):
+
+    def test_invalid_spec(self):
+        unit_log = UnitLog()
+        invalid_specs = [
+            {"test_configure_bad": {"file_log": True}},
+            {"test_configure_bad": {"level": "LOUD"}},
+            {"test_configure_bad": {"unknown_option": 1}},
+            {"test_configure_bad": {"file_log": True, "log_filepath": "a.log",
+                                    "file_log_mode": "x"}},
+            {"test_configure_bad": {"file_log": True,
+                                    "log_filepath": "./{date/a.log",
+                                    "log_path_template": True}},
+            {"test_configure_bad": {"columnar_log": True}},
+            [{"name": "test_configure_bad"}, {"name": "test_configure_bad"}],
+            [{"level": logging.INFO}],
+            {"test_configure_a": {"file_log": True, "log_filepath": "a.log"},
+             "test_configure_b": {"file_log": True, "log_filepath": "a.log",
+                                  "file_log_mode": "w"}},
+        ]
+        for spec in invalid_specs:
+            with self.assertRaises(ValueError):
+                unit_log.configure(spec)
+        # 校验失败时不会启动写日志进程
+        assert unit_log.worker is None
+
+    def test_configure(self):
+        if os.path.exists(LOG_FILEPATH):
+            os.remove(LOG_FILEPATH)
+        names = [f"test_configure.m{i}" for i in range(50)]
+        spec = {name: {"console_log": False, "file_log": True,
+                       "log_filepath": LOG_FILEPATH, "level": "DEBUG"}
+                for name in names}
+        spec["test_configure_console"] = {"caller_info": False}
+        for name in spec:
+            logging.getLogger(name).handlers.clear()
+        unit_log = UnitLog(priority_level=None)
+        loggers = unit_log.configure(spec)
+
+        assert list(loggers) == list(spec)
+        handlers = {id(loggers[name].handlers[0]) for name in names}
+        assert len(handlers) == 1
+        assert loggers[names[0]].level == logging.DEBUG
+        for name in names:
+            loggers[name].debug("from %s", name)
+        unit_log.stopped.set()
+        unit_log.worker.join(timeout=5)
+
+        with open(LOG_FILEPATH) as fp:
+            content = fp.read()
+        assert content.count("Log_filename") == 1
+        for name in names:
+            assert content.count(f"from {name}\n") == 1
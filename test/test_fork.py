@@ -0,0 +1,73 @@
+import os
+import time
+import logging
+import threading
+from unittest import TestCase
+
+from unitlog.unit import UnitLog
+
+LOG_FILEPATH = "./temp/test_fork.log"
+
+
+class TestFork(TestCase):
+
+    def test_fork_workers(self):
+        if os.path.exists(LOG_FILEPATH):
+            os.remove(LOG_FILEPATH)
+        unit_log = UnitLog()
+        logging.getLogger("test_fork").handlers.clear()
+        logger = unit_log.register_logger(
+            name="test_fork", console_log=False, file_log=True,
+            log_filepath=LOG_FILEPATH)
+
+        # fork 时父进程的 feeder 线程正在发送日志
+        parent_stop = threading.Event()
+        parent_num = [0]
+
+        def _parent_log():
+            while not parent_stop.is_set():
+                logger.info("parent %s", parent_num[0])
+                parent_num[0] += 1
+
+        parent_thread = threading.Thread(target=_parent_log)
+        parent_thread.start()
+        worker_num, record_num = 8, 200
+        pids = []
+        for worker_id in range(worker_num):
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    for i in range(record_num):
+                        logger.info("worker %s %s", worker_id, i)
+                    # 子进程退出不能停止共用的写日志进程
+                    unit_log.stop()
+                    code = 0
+                finally:
+                    os._exit(code)
+            pids.append(pid)
+        for pid in pids:
+            _, status = os.waitpid(pid, 0)
+            assert os.waitstatus_to_exitcode(status) == 0
+        parent_stop.set()
+        parent_thread.join()
+
+        assert not unit_log.stopped.is_set()
+        assert unit_log.worker.is_alive()
+        # Log_filename 日志
+        expect_num = 1 + worker_num * record_num + parent_num[0]
+        deadline = time.time() + 10
+        while (unit_log.written_num.value < expect_num
+               and time.time() < deadline):
+            time.sleep(0.01)
+        unit_log.stop()
+        unit_log.worker.join(timeout=5)
+
+        with open(LOG_FILEPATH) as fp:
+            lines = fp.read().splitlines()
+        for worker_id in range(worker_num):
+            assert len([line for line in lines
+                        if f" worker {worker_id} " in line]) == record_num
+        # 子进程不会重复发送父进程缓冲中的日志
+        assert len([line for line in lines
+                    if " parent " in line]) == parent_num[0]
@@ -0,0 +1,80 @@
+import gc
+import sys
+import logging
+from unittest import TestCase
+
+from unitlog.logger import UnitLogger, install_unit_logger, _INTERNAL_CODES
+
+
+class RecordCollector(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def log_with_stacklevel(logger):
+    logger.info("stacklevel", stacklevel=2)
+
+
+class TestUnitLogger(TestCase):
+
+    def setUp(self):
+        self.collector = RecordCollector()
+        self.logger = install_unit_logger(logging.getLogger("test_logger"))
+        self.logger.handlers = [self.collector]
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+    def assert_caller(self, record, lineno, func_name):
+        assert record.filename == "test_logger.py", record.filename
+        assert record.lineno == lineno, (record.lineno, lineno)
+        assert record.funcName == func_name, record.funcName
+
+    def test_find_caller(self):
+        assert isinstance(self.logger, UnitLogger)
+        records = self.collector.records
+        lineno = sys._getframe().f_lineno
+        self.logger.info("info")
+        self.logger.log(logging.WARNING, "log")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.logger.exception("exception")
+        log_with_stacklevel(self.logger)
+
+        self.assert_caller(records[0], lineno + 1, "test_find_caller")
+        self.assert_caller(records[1], lineno + 2, "test_find_caller")
+        self.assert_caller(records[2], lineno + 6, "test_find_caller")
+        self.assert_caller(records[3], lineno + 7, "test_find_caller")
+
+    def test_same_as_stdlib(self):
+        std_logger = logging.Logger("test_logger_std")
+        std_logger.handlers = [self.collector]
+        for _logger in (self.logger, std_logger):
+            _logger.warning("compare")
+        unit_record, std_record = self.collector.records
+        assert unit_record.pathname == std_record.pathname
+        assert unit_record.lineno == std_record.lineno
+        assert unit_record.funcName == std_record.funcName
+
+    def test_without_caller_info(self):
+        install_unit_logger(self.logger, caller_info=False)
+        self.logger.info("no caller")
+        record = self.collector.records[0]
+        assert record.lineno == 0
+        assert record.funcName == "(unknown function)"
+
+    def test_internal_code_cache(self):
+        code_num = len(_INTERNAL_CODES)
+        for i in range(100):
+            # 运行时生成的 code object 被回收后不留在缓存里
+            exec(compile(f"logger.info('exec {i}')", "<dynamic>", "exec"),
+                 {"logger": self.logger})
+        gc.collect()
+        assert len(self.collector.records) == 100
+        assert self.collector.records[-1].filename == "<dynamic>"
+        assert len(_INTERNAL_CODES) <= code_num + 1
@@ -0,0 +1,68 @@
+import os
+import logging
+import threading
+from unittest import TestCase
+
+from unitlog.capture import load_capture
+from unitlog.replay import replay
+from unitlog.unit import UnitLog, MODE_THREAD
+
+CAPTURE_FILEPATH = "./temp/test_replay/capture.jsonl"
+
+
+class TestReplay(TestCase):
+
+    def test_capture_and_replay(self):
+        unit_log = UnitLog(capture_filepath=CAPTURE_FILEPATH)
+        for name in ("test_replay_a", "test_replay_b"):
+            logging.getLogger(name).handlers.clear()
+        logger_a = unit_log.register_logger(
+            name="test_replay_a", console_log=False, file_log=True,
+            log_filepath="./temp/test_replay/a.log", file_log_mode="w")
+        logger_b = unit_log.register_logger(
+            name="test_replay_b", console_log=False, file_log=True,
+            log_filepath="./temp/test_replay/b.log", file_log_mode="w")
+
+        def _log_b():
+            for i in range(50):
+                logger_b.error("b %s %s", i, "y" * i)
+
+        thread = threading.Thread(target=_log_b)
+        thread.start()
+        for i in range(100):
+            logger_a.info("a %s", i)
+        thread.join()
+        unit_log.stopped.set()
+        unit_log.worker.join(timeout=5)
+
+        sinks, rows = load_capture(CAPTURE_FILEPATH)
+        assert sorted(sinks.values()) == ["file-./temp/test_replay/a.log",
+                                          "file-./temp/test_replay/b.log"]
+        # 2 条 Log_filename 日志
+        assert len(rows) == 152
+        assert {row[4] for row in rows} == {os.getpid()}
+        assert len({row[5] for row in rows}) == 2
+        error_rows = [row for row in rows if row[2] == logging.ERROR]
+        assert len(error_rows) == 50
+        assert len({row[3] for row in error_rows}) == 1
+        # 不记录日志内容, 只记录大小
+        with open(CAPTURE_FILEPATH) as fp:
+            assert "yyyy" not in fp.read()
+
+        result = replay(CAPTURE_FILEPATH, unit_log=UnitLog(mode=MODE_THREAD),
+                        speed=0, out_dir="./temp/test_replay/out")
+        assert result["completed"]
+        assert result["records"] == 152
+        assert result["streams"] == 2
+        assert result["written"] == 152
+        assert result["dropped"] == 0
+        assert result["records_per_second"] > 0
+        for sink_id, sink_name in sinks.items():
+            with open(f"./temp/test_replay/out/sink-{sink_id}.log") as fp:
+                lines = fp.read().splitlines(keepends=True)
+            # 回放时的 Log_filename 日志占两行, 采集到的日志各回放为一行
+            expect_num = 2 + 1 + (100 if sink_name.endswith("a.log") else 50)
+            assert len(lines) == expect_num
+            # 回放写出的大小与原日志相同
+            assert sum(len(line) for line in lines[2:]) == \
+                   os.path.getsize(sink_name.split("-", 1)[1])
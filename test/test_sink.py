@@ -0,0 +1,167 @@
+import os
+import time
+import tempfile
+import threading
+from unittest import TestCase
+
+from unitlog.handlers import LogBox
+from unitlog.sink import SinkWorker, SinkPool
+from unitlog.unit import PoxyFileLogWriter
+
+
+class ListWriter(object):
+
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.msgs = []
+
+    def emit(self, log_msg):
+        if self.gate is not None:
+            self.gate.wait()
+        self.msgs.append(log_msg)
+
+    def close(self):
+        pass
+
+
+class TestSinkWorker(TestCase):
+
+    def test_slow_sink_not_block_others(self):
+        gate = threading.Event()
+        slow = SinkWorker(ListWriter(gate), name="slow").start()
+        fast = SinkWorker(ListWriter(), name="fast").start()
+        for i in range(100):
+            slow.put(LogBox(log_msg=i))
+            fast.put(LogBox(log_msg=i))
+        fast.stop(timeout=3)
+        assert fast.writer.msgs == list(range(100))
+        assert slow.writer.msgs == []
+
+        gate.set()
+        slow.stop(timeout=3)
+        assert slow.writer.msgs == list(range(100))
+        assert slow.stats["written"] == 100
+
+    def test_bounded_queue_drop(self):
+        gate = threading.Event()
+        sink = SinkWorker(ListWriter(gate), name="bounded",
+                          max_size=10).start()
+        results = [sink.put(LogBox(log_msg=i)) for i in range(20)]
+        gate.set()
+        sink.stop(timeout=3)
+        assert results.count(False) == sink.stats["dropped"]
+        assert sink.stats["dropped"] >= 9
+        assert sink.stats["written"] + sink.stats["dropped"] == 20
+
+    def test_put_timeout(self):
+        gate = threading.Event()
+        sink = SinkWorker(ListWriter(gate), name="timeout",
+                          max_size=10).start()
+        threading.Timer(0.1, gate.set).start()
+        # 短时突发: 等待 sink 腾出空间, 不丢日志
+        results = [sink.put(LogBox(log_msg=i), timeout=3) for i in range(20)]
+        sink.stop(timeout=3)
+        assert all(results)
+        assert sink.writer.msgs == list(range(20))
+
+    def test_put_timeout_overloaded(self):
+        gate = threading.Event()
+        sink = SinkWorker(ListWriter(gate), name="overloaded",
+                          max_size=10).start()
+        for i in range(11):
+            sink.put(LogBox(log_msg=i))
+        # 持续阻塞: 只等待一次, 之后直接丢弃
+        assert sink.put(LogBox(log_msg="a"), timeout=0.05) is False
+        assert sink.put(LogBox(log_msg="b"), timeout=60) is False
+        gate.set()
+        sink.stop(timeout=3)
+
+    def test_priority_drained_first(self):
+        gate = threading.Event()
+        sink = SinkWorker(ListWriter(gate), name="priority").start()
+        for i in range(100):
+            sink.put(LogBox(log_msg=i))
+        sink.put(LogBox(log_msg="error", priority=True))
+        gate.set()
+        sink.stop(timeout=3)
+        # 第一条可能在 put priority 之前已经被 sink 线程取走
+        assert sink.writer.msgs.index("error") <= 1
+        assert sink.stats["priority_written"] == 1
+
+
+class TestSinkPool(TestCase):
+
+    def test_lru_evict_and_reopen(self):
+        pool = SinkPool(capacity=2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            def put(name, msg):
+                filepath = os.path.join(tmp_dir, name)
+
+                def factory(reopen):
+                    return SinkWorker(PoxyFileLogWriter(
+                        filepath, file_mode="a" if reopen else "w"),
+                        name=name).start()
+
+                return pool.put(name, LogBox(log_msg=msg), factory)
+
+            put("a.log", "a1\n")
+            put("b.log", "b1\n")
+            put("a.log", "a2\n")
+            # b 最久未使用, 被淘汰
+            put("c.log", "c1\n")
+            assert "b.log" not in pool and len(pool) == 2
+            put("b.log", "b2\n")
+            pool.close()
+
+            with open(os.path.join(tmp_dir, "b.log")) as fp:
+                assert fp.read() == "b1\nb2\n"
+            with open(os.path.join(tmp_dir, "a.log")) as fp:
+                assert fp.read() == "a1\na2\n"
+            assert pool.stats() == {
+                "open": 0, "capacity": 2, "hits": 1, "misses": 4,
+                "evictions": 2, "reopens": 1,
+            }
+
+    def test_evict_blocked_sink(self):
+        pool = SinkPool(capacity=1, close_timeout=0.2)
+        gate = threading.Event()
+        dropped = []
+        sinks = {
+            "blocked": SinkWorker(
+                ListWriter(gate), name="blocked",
+                on_drop=lambda sink, num: dropped.append(num)),
+            "other": SinkWorker(ListWriter(), name="other"),
+        }
+        for i in range(10):
+            pool.put("blocked", LogBox(log_msg=i),
+                     lambda reopen: sinks["blocked"].start())
+        # 淘汰卡住的 sink 在后台进行, 不阻塞其它 key
+        start = time.time()
+        pool.put("other", LogBox(log_msg=0),
+                 lambda reopen: sinks["other"].start())
+        assert time.time() - start < 0.1
+
+        # 旧 sink 还没关闭完时, 同一个 key 的日志先暂存, 也不阻塞分发线程
+        def reopen_factory(reopen):
+            assert reopen and "blocked" not in pool._closing
+            sinks["reopen"] = SinkWorker(ListWriter(), name="blocked-reopen")
+            return sinks["reopen"].start()
+
+        start = time.time()
+        for i in range(10, 13):
+            assert pool.put("blocked", LogBox(log_msg=i), reopen_factory)
+        assert time.time() - start < 0.1
+        # 关闭完成后重新打开, 暂存的日志按顺序写出
+        deadline = time.time() + 3
+        while "reopen" not in sinks and time.time() < deadline:
+            time.sleep(0.01)
+        pool.put("blocked", LogBox(log_msg=13), reopen_factory)
+        sinks["reopen"].stop(timeout=3)
+        assert sinks["reopen"].writer.msgs == [10, 11, 12, 13]
+        blocked = sinks["blocked"]
+        # 第一条卡在 emit, 其余 9 条超时未写出, 计为丢弃
+        assert dropped == [9] and blocked.stats["dropped"] == 9
+        gate.set()
+        assert blocked.join(timeout=3)
+        assert blocked.writer.msgs == [0]
+        pool.close()
@@ -0,0 +1,52 @@
+import os
+import sys
+import subprocess
+import multiprocessing as mp
+from unittest import TestCase
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程里切换 start method, 不影响其它测试
+SCRIPT = """
+import sys
+import multiprocessing as mp
+
+if __name__ == "__main__":
+    mp.set_start_method(sys.argv[1])
+    from unitlog.unit import UnitLog
+
+    unit_log = UnitLog(tail_size=10)
+    logger = unit_log.register_logger(
+        name="test_spawn", console_log=False, file_log=True,
+        log_filepath=sys.argv[2], file_log_mode="w")
+    for i in range(10):
+        logger.info("hello %s", i)
+    logger.error("error")
+    unit_log.stop()
+    unit_log.worker.join(timeout=5)
+    print(unit_log.worker.exitcode, unit_log.written_num.value)
+"""
+
+
+class TestStartMethod(TestCase):
+
+    def run_with(self, method):
+        log_filepath = f"./temp/test_spawn_{method}.log"
+        env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+        result = subprocess.run(
+            [sys.executable, "-c", SCRIPT, method, log_filepath],
+            env=env, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        # Log_filename 日志 + 11 条日志; ENV-TEST=test 时写日志进程还会打印统计
+        assert result.stdout.splitlines()[-1].split() == ["0", "12"], \
+            result.stdout + result.stderr
+        with open(log_filepath) as fp:
+            assert fp.read().count("hello") == 10
+
+    def test_spawn(self):
+        self.run_with("spawn")
+
+    def test_forkserver(self):
+        if "forkserver" not in mp.get_all_start_methods():
+            self.skipTest("forkserver is not available")
+        self.run_with("forkserver")
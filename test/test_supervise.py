@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import signal
+import logging
+import subprocess
+from unittest import TestCase
+
+from unitlog.unit import UnitLog
+
+LOG_FILEPATH = "./temp/test_supervise.log"
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# argv[1] 为 exit 时正常退出, 为 _exit 时跳过 atexit, 不会设置 stopped
+EXIT_SCRIPT = """
+import os
+import sys
+from unitlog.unit import UnitLog
+
+logger = UnitLog().register_logger(
+    name="test_supervise_exit", console_log=False, file_log=True,
+    log_filepath="./temp/test_supervise_exit.log")
+logger.info("hello")
+if sys.argv[1] == "_exit":
+    os._exit(0)
+"""
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class KillInCounterLog(UnitLog):
+    """ 写日志进程在更新计数器时被 kill
+    """
+
+    def _on_sink_emit(self, sink, log_box):
+        if "kill in counter" in log_box.log_msg:
+            with self._counter_lock:
+                os.kill(os.getpid(), signal.SIGKILL)
+        super()._on_sink_emit(sink, log_box)
+
+
+def read_log():
+    with open(LOG_FILEPATH, "r") as fp:
+        return fp.read()
+
+
+class TestSupervise(TestCase):
+
+    def setUp(self):
+        self.unit_log = UnitLog()
+        logging.getLogger("test_supervise").handlers.clear()
+
+    def tearDown(self):
+        self.unit_log.stopped.set()
+        if self.unit_log.worker is not None:
+            self.unit_log.worker.join(timeout=5)
+
+    def test_restart_writer(self):
+        logger = self.unit_log.register_logger(
+            name="test_supervise", console_log=False, file_log=True,
+            log_filepath=LOG_FILEPATH, file_log_mode="w")
+        logger.info("before kill")
+        assert wait_until(lambda: "before kill" in read_log())
+
+        old_pid = self.unit_log.worker.pid
+        os.kill(old_pid, signal.SIGKILL)
+        time.sleep(0.2)
+        logger.info("while restarting")
+
+        assert wait_until(lambda: self.unit_log.restart_num == 1)
+        assert self.unit_log.worker.pid != old_pid
+        logger.error("after restart")
+        assert wait_until(lambda: "after restart" in read_log())
+        assert wait_until(lambda: "while restarting" in read_log())
+        # 重启后以追加模式重新打开, 之前的日志还在
+        assert "before kill" in read_log()
+        assert self.unit_log.lost_num == 0
+
+    def test_restart_writer_killed_in_counter(self):
+        self.unit_log = KillInCounterLog()
+        logger = self.unit_log.register_logger(
+            name="test_supervise", console_log=False, file_log=True,
+            log_filepath=LOG_FILEPATH, file_log_mode="w")
+        logger.info("before kill")
+        assert wait_until(lambda: "before kill" in read_log())
+        old_pid = self.unit_log.worker.pid
+
+        logger.info("kill in counter")
+        assert wait_until(lambda: self.unit_log.restart_num == 1)
+        assert self.unit_log.worker.pid != old_pid
+        # 统计不会因为被 kill 的写日志进程卡住
+        stats = self.unit_log.writer_stats()
+        assert stats["written"] >= 2
+        logger.info("after restart")
+        assert wait_until(lambda: "after restart" in read_log())
+
+    def test_writer_exits_with_owner(self):
+        env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+        for how in ("exit", "exit", "exit", "_exit"):
+            # 写日志进程继承了 stdout, 退出之前 subprocess.run 不会返回
+            result = subprocess.run(
+                [sys.executable, "-c", EXIT_SCRIPT, how], env=env,
+                capture_output=True, text=True, timeout=10)
+            assert result.returncode == 0, result.stderr
+            assert "restarted" not in result.stderr, result.stderr
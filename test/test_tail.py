@@ -0,0 +1,80 @@
+import time
+import logging
+from unittest import TestCase
+
+from unitlog.tail import TailServer, TailSubscription
+from unitlog.unit import UnitLog
+
+LOG_FILEPATH = "./temp/test_tail.log"
+
+
+class TestTail(TestCase):
+
+    def setUp(self):
+        # 关闭高优先级通道, 保证写出顺序与打日志顺序一致
+        self.unit_log = UnitLog(tail_size=50, priority_level=None)
+        for name in ("test_tail", "test_tail.child", "test_tail_other"):
+            logging.getLogger(name).handlers.clear()
+        self.logger = self.unit_log.register_logger(
+            name="test_tail", console_log=False, file_log=True,
+            log_filepath=LOG_FILEPATH)
+        self.child_logger = self.unit_log.register_logger(
+            name="test_tail.child", console_log=False, file_log=True,
+            log_filepath=LOG_FILEPATH)
+        self.other_logger = self.unit_log.register_logger(
+            name="test_tail_other", console_log=False, file_log=True,
+            log_filepath="./temp/test_tail_other.log")
+
+    def tearDown(self):
+        self.unit_log.stopped.set()
+        self.unit_log.worker.join(timeout=5)
+
+    def test_tail(self):
+        for i in range(100):
+            self.logger.info("info %s", i)
+        self.child_logger.error("child error")
+        self.other_logger.error("other error")
+        self.unit_log.stopped.wait(0.5)
+
+        items = self.unit_log.tail(sink=LOG_FILEPATH, limit=0)
+        # 每个 sink 只保留最近 50 条
+        assert len(items) == 50
+        assert items[-1]["msg"].endswith("child error\n")
+
+        items = self.unit_log.tail(level=logging.ERROR)
+        assert [item["logger"] for item in items] == ["test_tail.child",
+                                                      "test_tail_other"]
+        items = self.unit_log.tail(logger_name="test_tail",
+                                   level=logging.ERROR)
+        assert [item["logger"] for item in items] == ["test_tail.child"]
+
+        stats = self.unit_log.writer_stats()
+        assert stats["written"] == stats["dispatched"] == 105
+        assert stats["sink_pool"]["open"] == 2
+
+    def test_subscribe(self):
+        with self.unit_log.subscribe(logger_name="test_tail",
+                                     level=logging.WARNING) as subscription:
+            self.logger.info("ignored")
+            self.other_logger.error("ignored")
+            self.logger.warning("warning")
+            self.child_logger.error("error")
+            first = subscription.recv(timeout=5)
+            second = subscription.recv(timeout=5)
+            assert subscription.recv(timeout=0.2) is None
+        assert first["msg"].endswith("warning\n")
+        assert second["levelname"] == "ERROR"
+
+    def test_subscriber_disconnect(self):
+        server = TailServer(self.unit_log.tail_address + "-server",
+                            sinks=lambda: [], stats=dict,
+                            poll_interval=0.05).start()
+        subscription = TailSubscription(server.address, None, {})
+        assert len(server.subscribers) == 1
+        # 断开的订阅者没有新日志时也会被清理
+        subscription.close()
+        deadline = time.time() + 3
+        while server.subscribers and time.time() < deadline:
+            time.sleep(0.01)
+        assert not server.subscribers
+        server.close()
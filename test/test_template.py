@@ -0,0 +1,86 @@
+import os
+import time
+import shutil
+import logging
+from unittest import TestCase
+
+from unitlog.template import compile_path_template
+from unitlog.unit import UnitLog
+
+LOG_DIR = "./temp/test_template"
+
+
+class TestPathTemplate(TestCase):
+
+    def test_resolve(self):
+        template = compile_path_template("./logs/{tenant}/{date}.log")
+        assert template is compile_path_template("./logs/{tenant}/{date}.log")
+        assert template.static_dir == "./logs"
+        created = time.mktime((2024, 5, 6, 12, 0, 0, 0, 0, -1))
+        assert template.resolve({"tenant": "t1"}, created) == \
+            "./logs/t1/2024-05-06.log"
+        assert template.resolve({}, created) == "./logs/unknown/2024-05-06.log"
+        assert template.resolve({"tenant": "../x"}, created) == \
+            "./logs/.._x/2024-05-06.log"
+
+    def test_static_path(self):
+        template = compile_path_template("./temp/test.log")
+        assert not template.is_dynamic
+        assert template.static_dir == "./temp"
+
+    def test_invalid_field(self):
+        with self.assertRaises(ValueError):
+            compile_path_template("./logs/{}.log")
+
+
+class TestTemplateRouting(TestCase):
+
+    def test_route_by_extra(self):
+        shutil.rmtree(LOG_DIR, ignore_errors=True)
+        unit_log = UnitLog(max_open_sinks=2)
+        logging.getLogger("test_template").handlers.clear()
+        logger = unit_log.register_logger(
+            name="test_template", console_log=False, file_log=True,
+            log_filepath=LOG_DIR + "/{tenant}/{logger}.log",
+            log_path_template=True)
+        for i in range(10):
+            logger.info("hello %s", i, extra={"tenant": f"tenant{i % 3}"})
+        unit_log.stopped.set()
+        unit_log.worker.join(timeout=5)
+
+        assert sorted(os.listdir(LOG_DIR)) == ["tenant0", "tenant1",
+                                               "tenant2"]
+        with open(os.path.join(LOG_DIR, "tenant0", "test_template.log")) as fp:
+            lines = fp.read().splitlines()
+        assert [line.split()[-1] for line in lines] == ["0", "3", "6", "9"]
+        # 3 个租户轮流写, 容量为 2 时每次都被淘汰; 不开启 tail 也能读取
+        assert unit_log.sink_pool_stats() == {
+            "open": 0, "capacity": 2, "hits": 0, "misses": 10,
+            "evictions": 8, "reopens": 7,
+        }
+        stats = unit_log.writer_stats()
+        assert stats["written"] == 10
+        assert stats["sink_pool"]["evictions"] == 8
+
+    def test_literal_braces(self):
+        # 不开启 log_path_template 时, 路径中的 {} 按原样使用
+        literal_dir = LOG_DIR + "_literal"
+        shutil.rmtree(literal_dir, ignore_errors=True)
+        log_filepaths = [literal_dir + "/run_{1}.log",
+                         literal_dir + "/{tenant}.log",
+                         literal_dir + "/stray_{.log"]
+        unit_log = UnitLog()
+        for i, log_filepath in enumerate(log_filepaths):
+            logging.getLogger(f"test_template_literal{i}").handlers.clear()
+            logger = unit_log.register_logger(
+                name=f"test_template_literal{i}", console_log=False,
+                file_log=True, log_filepath=log_filepath)
+            logger.info("hello", extra={"tenant": "t1"})
+        unit_log.stopped.set()
+        unit_log.worker.join(timeout=5)
+
+        assert sorted(os.listdir(literal_dir)) == sorted(
+            os.path.basename(log_filepath) for log_filepath in log_filepaths)
+        for log_filepath in log_filepaths:
+            with open(log_filepath) as fp:
+                assert fp.read().endswith("hello\n")
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+from queue import SimpleQueue
+from unittest import TestCase
+
+from unitlog.handlers import UnitConsoleHandler
+from unitlog.unit import UnitLog, MODE_THREAD, MODE_PROCESS
+
+LOG_FILEPATH = "./temp/test_thread_mode.log"
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def read_lines():
+    # Log_filename 日志占两行
+    with open(LOG_FILEPATH, "r") as fp:
+        return [line for line in fp.read().splitlines() if line]
+
+
+class TestThreadMode(TestCase):
+
+    def setUp(self):
+        self.unit_log = UnitLog(mode=MODE_THREAD)
+        logging.getLogger("test_thread_mode").handlers.clear()
+        self.logger = self.unit_log.register_logger(
+            name="test_thread_mode", console_log=False, file_log=True,
+            log_filepath=LOG_FILEPATH, file_log_mode="w")
+
+    def tearDown(self):
+        self.unit_log.stop()
+
+    def test_thread_writer(self):
+        for i in range(100):
+            self.logger.info("thread %s", i)
+        self.unit_log.stop()
+        assert self.unit_log.worker.is_alive() is False
+        assert len(read_lines()) == 102
+
+    def test_switch_to_process_on_fork(self):
+        for i in range(10):
+            self.logger.info("before fork %s", i)
+        pid = os.fork()
+        if pid == 0:
+            for i in range(10):
+                self.logger.info("child %s", i)
+            self.logger.error("child error")
+            # 子进程只把缓冲的日志发送完, 不停止共用的写日志进程
+            self.unit_log.stop()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        assert self.unit_log.mode == MODE_PROCESS
+        for i in range(10):
+            self.logger.info("after fork %s", i)
+
+        assert wait_until(lambda: len(read_lines()) == 33)
+        lines = read_lines()
+        assert sum("before fork" in line for line in lines) == 10
+        assert sum("child" in line for line in lines) == 11
+        assert sum("after fork" in line for line in lines) == 10
+
+
+class StaleQueue(object):
+    """ put 的同时 handler 的队列被换掉, 且旧队列已经排空过
+    """
+
+    def __init__(self, handler, new_queue):
+        self.handler = handler
+        self.new_queue = new_queue
+        self.queue = SimpleQueue()
+
+    def put(self, log_box):
+        self.queue.put(log_box)
+        self.handler.bus_queue = self.new_queue
+
+    def get_nowait(self):
+        return self.queue.get_nowait()
+
+
+class TestQueueSwitch(TestCase):
+
+    def test_put_to_stale_queue(self):
+        handler = UnitConsoleHandler(priority_queue=None)
+        new_queue = SimpleQueue()
+        stale_queue = StaleQueue(handler, new_queue)
+        handler.bus_queue = stale_queue
+        record = logging.LogRecord("test_thread_mode", logging.INFO, __file__,
+                                   1, "switching", None, None)
+        handler.handle(record)
+        assert stale_queue.queue.empty()
+        assert new_queue.get_nowait().log_msg == "switching\n"
@@ -0,0 +1,117 @@
+import gc
+import os
+import sys
+import weakref
+import logging
+from unittest import TestCase
+
+from unitlog.formatter import UnitFormatter
+from unitlog.sink import TracebackDeduper
+from unitlog.unit import UnitLog
+
+LOG_FILEPATH = "./temp/test_traceback_dedup.log"
+
+
+def fail(i):
+    raise ValueError("bad value")
+
+
+class Payload(object):
+    pass
+
+
+def fail_with_local(payload_ref):
+    payload = Payload()
+    payload_ref.append(weakref.ref(payload))
+    raise ValueError("bad value")
+
+
+def catch_exc_info():
+    try:
+        fail(0)
+    except ValueError:
+        return sys.exc_info()
+
+
+class TestTracebackDedup(TestCase):
+
+    def test_format_exception_cache(self):
+        formatter = UnitFormatter(cache_exc_text=True)
+        ei = catch_exc_info()
+        # 同一个异常只格式化一次
+        assert formatter.formatException(ei) is formatter.formatException(ei)
+        other_ei = catch_exc_info()
+        assert formatter.formatException(other_ei) == \
+               formatter.formatException(ei)
+        assert formatter.formatException(other_ei) is not \
+               formatter.formatException(ei)
+
+    def test_format_exception_not_hold_frames(self):
+        payload_ref = []
+        for cache_exc_text in (False, True):
+            formatter = UnitFormatter(cache_exc_text=cache_exc_text)
+            try:
+                fail_with_local(payload_ref)
+            except ValueError:
+                exc_text = formatter.formatException(sys.exc_info())
+            assert "bad value" in exc_text
+            gc.collect()
+            # 异常处理完后, 抛出异常的 frame 中的局部变量可以被释放
+            assert payload_ref[-1]() is None
+
+    def test_deduper(self):
+        deduper = TracebackDeduper(window=10)
+        exc_text = "Traceback (most recent call last):\nValueError: bad"
+        digest = deduper.digest(exc_text)[:6]
+        assert deduper.render(exc_text, now=0) == \
+               f"[traceback #{digest}]\n{exc_text}"
+        assert deduper.render(exc_text, now=1) == \
+               f"[traceback #{digest} seen 2x]"
+        assert deduper.render(exc_text, now=2) == \
+               f"[traceback #{digest} seen 3x]"
+        # 窗口过期后重新写出完整堆栈
+        assert deduper.render(exc_text, now=11) == \
+               f"[traceback #{digest}]\n{exc_text}"
+
+    def test_dedup_file(self):
+        if os.path.exists(LOG_FILEPATH):
+            os.remove(LOG_FILEPATH)
+        # 关闭高优先级通道, 保证写出顺序与打日志顺序一致
+        unit_log = UnitLog(traceback_dedup_window=60, priority_level=None)
+        logging.getLogger("test_traceback_dedup").handlers.clear()
+        logger = unit_log.register_logger(
+            name="test_traceback_dedup", console_log=False, file_log=True,
+            log_filepath=LOG_FILEPATH)
+        for i in range(5):
+            try:
+                fail(i)
+            except ValueError:
+                logger.exception("failed %s", i)
+        logger.info("done")
+        unit_log.stopped.set()
+        unit_log.worker.join(timeout=5)
+
+        with open(LOG_FILEPATH) as fp:
+            content = fp.read()
+        assert content.count("Traceback (most recent call last)") == 1
+        assert content.count("ValueError: bad value") == 1
+        assert "seen 5x]" in content
+        for i in range(5):
+            assert f"failed {i}\n[traceback #" in content
+        assert content.endswith("done\n")
+
+    def test_deduper_ref_collision(self):
+        deduper = TracebackDeduper(window=10)
+        # 找两个 6 位引用相同的不同堆栈, 两个都要写出完整堆栈
+        refs = {}
+        i = 0
+        while True:
+            exc_text = f"Traceback (most recent call last):\nValueError: {i}"
+            ref = deduper.digest(exc_text)[:6]
+            if ref in refs:
+                break
+            refs[ref] = exc_text
+            i += 1
+        assert deduper.render(refs[ref], now=0).endswith(refs[ref])
+        assert deduper.render(exc_text, now=1).endswith(exc_text)
+        assert deduper.render(exc_text, now=2) == f"[traceback #{ref} seen 2x]"
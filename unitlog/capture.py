@@ -0,0 +1,79 @@
+"""
+写日志进程内的流量采集, 只记录流量形态, 不记录日志内容, 用 unitlog.replay 回放
+
+文件格式 (jsonl):
+    {"sink_id": 0, "sink": "file-./logs/a.log"}   sink 第一次出现时声明
+    [created, size, levelno, sink_id, pid, tid]   每条日志一行
+"""
+import os
+import json
+import threading
+
+
+def _read_sinks(filepath) -> dict:
+    sinks = {}
+    with open(filepath, "r", encoding="utf-8") as fp:
+        for line in fp:
+            if line.startswith("{"):
+                sink = json.loads(line)
+                sinks[sink["sink"]] = sink["sink_id"]
+    return sinks
+
+
+class TrafficCapture(object):
+    """ 由各分发线程调用 record, 写入有缓冲, 写日志进程被 kill 时会丢失最后一部分
+    """
+
+    def __init__(self, filepath, file_mode="w"):
+        dir_path = os.path.dirname(os.path.abspath(filepath))
+        os.makedirs(dir_path, exist_ok=True)
+        self.filepath = filepath
+        # sink 名字 -> sink_id, 追加时沿用文件中已声明的 id
+        self._sink_ids = {}
+        if file_mode == "a" and os.path.exists(filepath):
+            self._sink_ids = _read_sinks(filepath)
+        self.fp = open(filepath, file_mode, encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def record(self, sink_name, log_box):
+        log_msg = log_box.log_msg
+        size = len(log_msg) if isinstance(log_msg, str) else 0
+        if log_box.exc_text:
+            size += len(log_box.exc_text)
+        with self._lock:
+            if self.fp.closed:
+                return
+            sink_id = self._sink_ids.get(sink_name)
+            if sink_id is None:
+                sink_id = len(self._sink_ids)
+                self._sink_ids[sink_name] = sink_id
+                self.fp.write(json.dumps({"sink_id": sink_id,
+                                          "sink": sink_name}) + "\n")
+            self.fp.write(f"[{log_box.created_at:.6f},{size},"
+                          f"{log_box.levelno},{sink_id},{log_box.pid},"
+                          f"{log_box.tid}]\n")
+
+    def close(self):
+        with self._lock:
+            self.fp.close()
+
+
+def load_capture(filepath) -> (dict, list):
+    """
+    :return: ({sink_id: sink 名字}, [(created, size, levelno, sink_id, pid, tid), ...])
+    """
+    sinks = {}
+    rows = []
+    with open(filepath, "r", encoding="utf-8") as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:  # 写日志进程被 kill 时最后一行可能不完整
+                continue
+            if isinstance(item, dict):
+                sinks[item["sink_id"]] = item["sink"]
+            else:
+                rows.append(tuple(item))
+    return sinks, rows
@@ -0,0 +1,167 @@
+"""
+列式日志文件, 用于 time_cost 等数值型 extra 的分析
+
+文件格式:
+    header (HEADER_SIZE 字节): magic, row_count, 自定义列名 (json)
+    rows: 定长行, ts(f8) level(u4) logger_id(u4) func_id(u4) pad(4) + 每列一个 f8
+    <filepath>.names: logger / func 名字的 intern 表, 每行一个 json ["logger", name]
+"""
+import os
+import json
+import mmap
+import struct
+
+MAGIC = b"ULCOL001"
+HEADER_SIZE = 4096
+# magic, row_count, columns json 长度
+HEADER_STRUCT = struct.Struct("<8sQI")
+ROW_PREFIX_FORMAT = "<dIII4x"
+GROW_ROWS = 4096
+
+
+def row_struct(columns) -> struct.Struct:
+    return struct.Struct(ROW_PREFIX_FORMAT + "d" * len(columns))
+
+
+def read_header(fp) -> (int, tuple):
+    fp.seek(0)
+    header = fp.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise ValueError("not a unitlog columnar file: header too short")
+    magic, row_count, columns_size = HEADER_STRUCT.unpack_from(header)
+    if magic != MAGIC:
+        raise ValueError(f"not a unitlog columnar file: bad magic {magic}")
+    columns_json = header[HEADER_STRUCT.size:HEADER_STRUCT.size + columns_size]
+    return row_count, tuple(json.loads(columns_json.decode("utf-8")))
+
+
+def read_names(log_filepath) -> dict:
+    names = {"logger": [], "func": []}
+    names_filepath = f"{log_filepath}.names"
+    if os.path.exists(names_filepath):
+        with open(names_filepath, "r", encoding="utf-8") as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                kind, name = json.loads(line)
+                names[kind].append(name)
+    return names
+
+
+class PoxyColumnarLogWriter(object):
+    """ 以定长行追加到 mmap 文件, log_msg 为
+        (created, levelno, logger_name, func_name, (column values...))
+    """
+
+    def __init__(self, log_filepath, columns, file_mode="a"):
+        self.log_filepath = log_filepath
+        self.columns = tuple(columns)
+        self.row_struct = row_struct(self.columns)
+        self.row_count = 0
+        self.capacity = 0
+        self._interned = {"logger": {}, "func": {}}
+
+        columns_json = json.dumps(list(self.columns)).encode("utf-8")
+        if HEADER_STRUCT.size + len(columns_json) > HEADER_SIZE:
+            raise ValueError(f"too many columns: {self.columns}")
+
+        exists = (file_mode != "w" and os.path.exists(log_filepath)
+                  and os.path.getsize(log_filepath) >= HEADER_SIZE)
+        self.fp = open(log_filepath, "r+b" if exists else "w+b")
+        if exists:
+            self.row_count, columns = read_header(self.fp)
+            if columns != self.columns:
+                self.fp.close()
+                raise ValueError(f"columnar file {log_filepath} has columns "
+                                 f"{columns}, expect {self.columns}")
+            for kind, names in read_names(log_filepath).items():
+                self._interned[kind] = {n: i for i, n in enumerate(names)}
+            self.names_fp = open(f"{log_filepath}.names", "a",
+                                 encoding="utf-8")
+        else:
+            self.fp.write(HEADER_STRUCT.pack(MAGIC, 0, len(columns_json)))
+            self.fp.write(columns_json)
+            self.names_fp = open(f"{log_filepath}.names", "w",
+                                 encoding="utf-8")
+        self.mm = None
+        self._grow(self.row_count + GROW_ROWS)
+
+    def _grow(self, capacity):
+        if self.mm is not None:
+            self.mm.close()
+        self.capacity = capacity
+        self.fp.truncate(HEADER_SIZE + capacity * self.row_struct.size)
+        self.mm = mmap.mmap(self.fp.fileno(), 0)
+
+    def _intern(self, kind, name) -> int:
+        interned = self._interned[kind]
+        name_id = interned.get(name)
+        if name_id is None:
+            name_id = len(interned)
+            interned[name] = name_id
+            self.names_fp.write(json.dumps([kind, name]) + "\n")
+            self.names_fp.flush()
+        return name_id
+
+    def emit(self, log_msg):
+        created, levelno, logger_name, func_name, values = log_msg
+        if self.row_count >= self.capacity:
+            self._grow(self.capacity * 2)
+        self.row_struct.pack_into(
+            self.mm, HEADER_SIZE + self.row_count * self.row_struct.size,
+            created, levelno, self._intern("logger", logger_name),
+            self._intern("func", func_name), *values)
+        self.row_count += 1
+        # 先写行再更新行数, 读取方看到的行总是完整的
+        struct.pack_into("<Q", self.mm, 8, self.row_count)
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        self.fp.truncate(HEADER_SIZE + self.row_count * self.row_struct.size)
+        self.fp.close()
+        self.names_fp.close()
+
+
+def iter_columnar_rows(log_filepath):
+    """ 不依赖 numpy 的逐行读取,
+        yield (created, levelno, logger_name, func_name, {column: value})
+    """
+    names = read_names(log_filepath)
+    with open(log_filepath, "rb") as fp:
+        row_count, columns = read_header(fp)
+        _row_struct = row_struct(columns)
+        fp.seek(HEADER_SIZE)
+        for _ in range(row_count):
+            row = _row_struct.unpack(fp.read(_row_struct.size))
+            created, levelno, logger_id, func_id = row[:4]
+            yield (created, levelno, names["logger"][logger_id],
+                   names["func"][func_id], dict(zip(columns, row[4:])))
+
+
+def load_columnar(log_filepath) -> dict:
+    """ 以 numpy 数组返回所有列:
+        ts, level, logger_id, func_id, 自定义列, 以及 loggers / funcs 名字表,
+        例: data["funcs"][data["func_id"]] 得到每行的函数名
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("load_columnar requires numpy, "
+                          "install it with: pip install unitlog[columnar]")
+
+    with open(log_filepath, "rb") as fp:
+        row_count, columns = read_header(fp)
+    names = ["ts", "level", "logger_id", "func_id"] + list(columns)
+    formats = ["<f8", "<u4", "<u4", "<u4"] + ["<f8"] * len(columns)
+    offsets = [0, 8, 12, 16] + [24 + 8 * i for i in range(len(columns))]
+    dtype = np.dtype({"names": names, "formats": formats,
+                      "offsets": offsets,
+                      "itemsize": row_struct(columns).size})
+    rows = np.fromfile(log_filepath, dtype=dtype, count=row_count,
+                       offset=HEADER_SIZE)
+    data = {name: np.ascontiguousarray(rows[name]) for name in names}
+    file_names = read_names(log_filepath)
+    data["loggers"] = np.array(file_names["logger"], dtype=object)
+    data["funcs"] = np.array(file_names["func"], dtype=object)
+    return data
@@ -0,0 +1,49 @@
+import logging
+
+
+class UnitFormatter(logging.Formatter):
+    """ 同一个异常 (同一个 exception + traceback 对象) 被多次打日志时,
+        只调用一次 traceback.format_exception
+    """
+    # 格式化后的堆栈保存在异常对象上, 随异常一起释放, 不会延长 frame 及其局部变量的生命周期
+    EXC_TEXT_ATTR = "_unitlog_exc_text"
+
+    def __init__(self, *args, cache_exc_text=False, **kwargs):
+        """
+        :param cache_exc_text: 缓存异常堆栈的格式化结果, 异常堆栈去重时开启
+        """
+        super().__init__(*args, **kwargs)
+        self.cache_exc_text = cache_exc_text
+
+    def formatException(self, ei):
+        _, exc, tb = ei
+        if exc is None or not self.cache_exc_text:
+            return super().formatException(ei)
+        # 只记 traceback 的 id, 异常的 traceback 被换掉后不会继续持有旧的 frame;
+        # 同一个异常再次抛出后 traceback 会变长, 需要重新格式化
+        current = tb is not None and tb is exc.__traceback__
+        cached = getattr(exc, self.EXC_TEXT_ATTR, None)
+        if current and cached is not None and cached[0] == id(tb):
+            return cached[1]
+        exc_text = super().formatException(ei)
+        if current:
+            try:
+                setattr(exc, self.EXC_TEXT_ATTR, (id(tb), exc_text))
+            except (AttributeError, TypeError):
+                pass
+        return exc_text
+
+    def format_parts(self, record) -> (str, str):
+        """ 与 format 相同, 但把异常堆栈单独返回, 供写日志进程去重
+        """
+        record.message = record.getMessage()
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+        s = self.formatMessage(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        exc_text = record.exc_text or ""
+        if record.stack_info:
+            stack_text = self.formatStack(record.stack_info)
+            exc_text = f"{exc_text}\n{stack_text}" if exc_text else stack_text
+        return s, exc_text
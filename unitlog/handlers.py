@@ -1,22 +1,62 @@
+import os
+import time
 import logging
+import threading
 import multiprocessing as mp
+from queue import Empty
+
+from unitlog.formatter import UnitFormatter
+from unitlog.template import compile_path_template
+
+
+# 打日志进程的 pid, fork 后在子进程中重新获取
+_PID = os.getpid()
+
+
+def _reset_pid():
+    global _PID
+    _PID = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pid)
 
 
 class LogBox(object):
     def __init__(self, log_msg, log_type="console",
-                 log_filepath="", file_mode="a"):
+                 log_filepath="", file_mode="a", priority=False,
+                 path_values=None, columns=None, logger_name="",
+                 levelno=logging.NOTSET, exc_text=None):
         self.log_msg = log_msg
         self.log_type = log_type
         self.log_filepath = log_filepath
         self.file_mode = file_mode
+        self.priority = priority
+        # log_filepath 为模板时, 由写日志进程用这些字段值解析出真实路径
+        self.path_values = path_values
+        # columnar sink 的自定义列
+        self.columns = columns
+        self.logger_name = logger_name
+        self.levelno = levelno
+        # 去重模式下异常堆栈不拼进 log_msg, 由写日志进程按内容 hash 去重后写出
+        self.exc_text = exc_text
+        self.created_at = time.time()
+        # 流量采集用来区分生产者
+        self.pid = _PID
+        self.tid = threading.get_ident()
 
 
 class UnitHandler(logging.StreamHandler):
     LOG_TYPE = "console"
 
-    def __init__(self, stream=None, bus_queue=None):
+    def __init__(self, stream=None, bus_queue=None, priority_queue=None,
+                 priority_level=logging.ERROR, dedup_traceback=False):
         super().__init__(stream)
         self.bus_queue = bus_queue
+        # 高优先级通道, 达到 priority_level 的日志绕过 bus_queue 里积压的日志
+        self.priority_queue = priority_queue
+        self.priority_level = priority_level
+        self.dedup_traceback = dedup_traceback
 
     def handle(self, record):
         """ without acquiring lock
@@ -31,23 +71,70 @@ class UnitHandler(logging.StreamHandler):
             #     self.release()
         return rv
 
-    def wrap_msg(self, log_msg) -> LogBox:
-        return LogBox(log_msg=log_msg, log_type=self.LOG_TYPE)
+    def is_priority(self, record) -> bool:
+        return (self.priority_queue is not None
+                and record.levelno >= self.priority_level)
+
+    def wrap_msg(self, log_msg, record, priority=False) -> LogBox:
+        return LogBox(log_msg=log_msg, log_type=self.LOG_TYPE,
+                      priority=priority, logger_name=record.name,
+                      levelno=record.levelno)
+
+    def build_log_msg(self, record):
+        msg = self.format(record)
+        # issue 35046: merged two stream.writes into one.
+        return msg + self.terminator
+
+    def split_exc_text(self, record) -> (str, str):
+        """ 日志正文和异常堆栈分开, 正文不带 terminator
+        """
+        formatter = self.formatter
+        if not isinstance(formatter, UnitFormatter):
+            return self.build_log_msg(record), None
+        msg, exc_text = formatter.format_parts(record)
+        if not exc_text:
+            return msg + self.terminator, None
+        return msg, exc_text
 
     def emit(self, record):
         """ send to queue
         """
         # noinspection PyBroadException
         try:
-            msg = self.format(record)
-            # issue 35046: merged two stream.writes into one.
-            log_msg = msg + self.terminator
-            self.bus_queue.put(self.wrap_msg(log_msg))
+            exc_text = None
+            if self.dedup_traceback and (record.exc_info or record.exc_text
+                                         or record.stack_info):
+                log_msg, exc_text = self.split_exc_text(record)
+            else:
+                log_msg = self.build_log_msg(record)
+            priority = self.is_priority(record)
+            log_box = self.wrap_msg(log_msg, record, priority=priority)
+            log_box.exc_text = exc_text
+            queue = self.priority_queue if priority else self.bus_queue
+            queue.put(log_box)
+            if queue is not (self.priority_queue if priority
+                             else self.bus_queue):
+                self._move_stale(queue, priority)
         except RecursionError:  # See issue 36272
             raise
         except Exception:
             self.handleError(record)
 
+    def _move_stale(self, stale_queue, priority):
+        """ thread 模式切换为 process 模式时, 队列在 put 之前被换掉了,
+            旧队列可能已经被排空, 把刚放进去的日志转移到新队列
+        """
+        while True:
+            try:
+                log_box = stale_queue.get_nowait()
+            except Empty:
+                return
+            if log_box is None:
+                # 写日志线程还没退出, 剩下的日志由切换时的排空处理
+                stale_queue.put(None)
+                return
+            (self.priority_queue if priority else self.bus_queue).put(log_box)
+
 
 class UnitConsoleHandler(UnitHandler):
     LOG_TYPE = "console"
@@ -56,12 +143,64 @@ class UnitConsoleHandler(UnitHandler):
 class UnitFileHandler(UnitHandler):
     LOG_TYPE = "file"
 
-    def __init__(self, log_filepath, mode, bus_queue=None):
-        super().__init__(bus_queue=bus_queue)
+    def __init__(self, log_filepath, mode, bus_queue=None,
+                 priority_queue=None, priority_level=logging.ERROR,
+                 dedup_traceback=False, log_path_template=False):
+        """
+        :param log_path_template: log_filepath 是否按模板解析, 默认按原样使用
+        """
+        super().__init__(bus_queue=bus_queue, priority_queue=priority_queue,
+                         priority_level=priority_level,
+                         dedup_traceback=dedup_traceback)
         self.log_filepath = log_filepath
         self.mode = mode
+        self.path_template = None
+        if log_path_template:
+            path_template = compile_path_template(log_filepath)
+            if path_template.is_dynamic:
+                self.path_template = path_template
 
-    def wrap_msg(self, log_msg) -> LogBox:
+    def wrap_msg(self, log_msg, record, priority=False) -> LogBox:
+        path_values = None
+        if self.path_template is not None:
+            path_values = self.path_template.record_values(record)
         return LogBox(log_msg=log_msg, log_type=self.LOG_TYPE,
                       log_filepath=self.log_filepath,
-                      file_mode=self.mode)
+                      file_mode=self.mode, priority=priority,
+                      path_values=path_values, logger_name=record.name,
+                      levelno=record.levelno)
+
+
+class UnitColumnarHandler(UnitHandler):
+    """ 不格式化文本, 只把时间、级别、logger、函数名和数值型 extra 发给写日志进程
+    """
+    LOG_TYPE = "columnar"
+
+    def __init__(self, log_filepath, columns=("time_cost", ), mode="a",
+                 bus_queue=None, priority_queue=None,
+                 priority_level=logging.ERROR):
+        super().__init__(bus_queue=bus_queue, priority_queue=priority_queue,
+                         priority_level=priority_level)
+        self.log_filepath = log_filepath
+        self.columns = tuple(columns)
+        self.mode = mode
+
+    def build_log_msg(self, record):
+        nan = float("nan")
+        values = []
+        for column in self.columns:
+            value = getattr(record, column, nan)
+            try:
+                values.append(float(value))
+            except (TypeError, ValueError):
+                values.append(nan)
+        # log_func_cost 会在 extra 中带上被统计的函数名
+        func_name = getattr(record, "func_name", None) or record.funcName
+        return (record.created, record.levelno, record.name,
+                func_name or "", tuple(values))
+
+    def wrap_msg(self, log_msg, record, priority=False) -> LogBox:
+        return LogBox(log_msg=log_msg, log_type=self.LOG_TYPE,
+                      log_filepath=self.log_filepath, file_mode=self.mode,
+                      priority=priority, columns=self.columns,
+                      logger_name=record.name, levelno=record.levelno)
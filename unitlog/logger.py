@@ -0,0 +1,71 @@
+import os
+import sys
+import logging
+import weakref
+
+UNKNOWN_CALLER = ("(unknown file)", 0, "(unknown function)", None)
+
+# id(code object) -> (code object 的弱引用, 是否为 logging 内部的栈帧),
+# 同一个 code object 只判断一次; 不持有 code object, 运行时 compile / exec
+# 生成的 code object 被回收后自动移除.
+# WeakKeyDictionary 每次查找都要创建弱引用, 会让 findCaller 慢一倍以上
+_INTERNAL_CODES = {}
+
+
+def _is_internal_code(code) -> bool:
+    entry = _INTERNAL_CODES.get(id(code))
+    if entry is not None and entry[0]() is code:
+        return entry[1]
+    filename = os.path.normcase(code.co_filename)
+    # 与 logging._is_internal_frame 的判断一致
+    # noinspection PyProtectedMember,PyUnresolvedReferences
+    internal = (filename == logging._srcfile
+                or ("importlib" in filename and "_bootstrap" in filename))
+    key = id(code)
+    _INTERNAL_CODES[key] = (
+        weakref.ref(code, lambda _, k=key: _INTERNAL_CODES.pop(k, None)),
+        internal)
+    return internal
+
+
+class UnitLogger(logging.Logger):
+    """ register_logger 创建的 logger 使用的 Logger,
+        findCaller 从固定深度的栈帧开始查找, 内部栈帧的判断按 code object 缓存,
+        caller_info 为 False 时完全跳过调用者信息的查找
+    """
+    caller_info = True
+
+    def findCaller(self, stack_info=False, stacklevel=1):
+        if not self.caller_info:
+            return UNKNOWN_CALLER
+        if stack_info:
+            return super().findCaller(stack_info=stack_info,
+                                      stacklevel=stacklevel)
+        try:
+            # 0: findCaller, 1: Logger._log, 2: Logger.info 等
+            frame = sys._getframe(2)
+        except ValueError:
+            return UNKNOWN_CALLER
+        while frame is not None:
+            if not _is_internal_code(frame.f_code):
+                stacklevel -= 1
+                if stacklevel <= 0:
+                    break
+            if frame.f_back is None:
+                break
+            frame = frame.f_back
+        if frame is None:
+            return UNKNOWN_CALLER
+        code = frame.f_code
+        return code.co_filename, frame.f_lineno, code.co_name, None
+
+
+def install_unit_logger(logger: logging.Logger,
+                        caller_info=True) -> logging.Logger:
+    """ 只替换普通的 logging.Logger, 不影响用户自定义的 Logger 子类
+    """
+    if type(logger) is logging.Logger:
+        logger.__class__ = UnitLogger
+    if isinstance(logger, UnitLogger):
+        logger.caller_info = caller_info
+    return logger
@@ -0,0 +1,167 @@
+"""
+回放 capture_filepath 采集的流量, 用于在接近线上的负载下比较不同的 UnitLog 配置
+
+    python -m unitlog.replay ./logs/capture.jsonl --speed 2 --mode thread
+
+每个 (pid, tid) 生产者用一个线程按原始时间间隔回放, 写出的每行与原日志等长 (填充字符),
+console sink 也回放到文件, 避免干扰终端输出
+"""
+import os
+import time
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+
+from unitlog.capture import load_capture
+from unitlog.unit import UnitLog, MODE_PROCESS, MODE_THREAD
+
+REPLAY_LOGGER_PREFIX = "unitlog_replay"
+BARE_FORMATTER = logging.Formatter("%(message)s")
+
+
+def _register_sink_loggers(unit_log, sinks, out_dir) -> (dict, int):
+    """
+    :return: ({sink_id: logger}, 注册时写出的 Log_filename 日志条数)
+    """
+    loggers = {}
+    log_filename_num = 0
+    for sink_id, sink_name in sinks.items():
+        name = f"{REPLAY_LOGGER_PREFIX}.{sink_id}"
+        logging.getLogger(name).handlers.clear()
+        if sink_name.split("-", 1)[0] == "columnar":
+            loggers[sink_id] = unit_log.register_logger(
+                name, level=1, console_log=False, columnar_log=True,
+                columnar_filepath=os.path.join(out_dir, f"sink-{sink_id}.col"),
+                columnar_mode="w")
+        else:
+            loggers[sink_id] = unit_log.register_logger(
+                name, level=1, console_log=False, file_log=True,
+                log_filepath=os.path.join(out_dir, f"sink-{sink_id}.log"),
+                file_log_mode="w")
+            log_filename_num += 1
+        # 采集的大小已经是格式化后的整行, 回放时不再加时间、级别等前缀
+        for handler in loggers[sink_id].handlers:
+            handler.setFormatter(BARE_FORMATTER)
+    return loggers, log_filename_num
+
+
+def _wait_done(unit_log, expect_num, timeout) -> bool:
+    deadline = time.time() + timeout
+    while (unit_log.written_num.value + unit_log.dropped_num.value
+           < expect_num):
+        if time.time() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def replay(capture_filepath, unit_log: UnitLog = None, speed=1.0,
+           out_dir="./temp/replay", timeout=60) -> dict:
+    """
+    :param unit_log: 要测试的配置, 默认 UnitLog(), 回放结束后会被 stop
+    :param speed: 回放速度倍数, 0 表示不保留时间间隔, 尽可能快地回放
+    :param timeout: 回放结束后等待写日志进程写完的最长秒数
+    """
+    sinks, rows = load_capture(capture_filepath)
+    if not rows:
+        raise ValueError(f"no records in capture file {capture_filepath}")
+    unit_log = unit_log or UnitLog()
+    os.makedirs(out_dir, exist_ok=True)
+    base_num = unit_log.written_num.value + unit_log.dropped_num.value
+    loggers, log_filename_num = _register_sink_loggers(unit_log, sinks,
+                                                       out_dir)
+    base_num += log_filename_num
+    if not _wait_done(unit_log, base_num, timeout):
+        raise TimeoutError("unit log writer is not ready")
+    base_written = unit_log.written_num.value
+    base_dropped = unit_log.dropped_num.value
+
+    streams = OrderedDict()
+    for created, size, levelno, sink_id, pid, tid in rows:
+        streams.setdefault((pid, tid), []).append((created, size, levelno,
+                                                   sink_id))
+    for stream in streams.values():
+        stream.sort(key=lambda row: row[0])
+    first_created = min(row[0] for row in rows)
+    payload = "x" * max(row[1] for row in rows)
+    slips = []
+
+    def _replay_stream(stream):
+        max_slip = 0.0
+        for created, size, levelno, sink_id in stream:
+            if speed:
+                delay = start + (created - first_created) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                elif -delay > max_slip:
+                    max_slip = -delay
+            # handler 会加上换行符
+            loggers[sink_id].log(max(levelno, 1), payload[:max(size - 1, 0)])
+        slips.append(max_slip)
+
+    threads = [threading.Thread(target=_replay_stream, args=(stream, ),
+                                name=f"unitlog-replay-{pid}-{tid}")
+               for (pid, tid), stream in streams.items()]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    produce_cost = time.time() - start
+    done = _wait_done(unit_log, base_num + len(rows), timeout)
+    cost = time.time() - start
+    unit_log.stop()
+
+    total_size = sum(row[1] for row in rows)
+    return {
+        "records": len(rows),
+        "streams": len(streams),
+        "sinks": len(sinks),
+        "captured_seconds": max(row[0] for row in rows) - first_created,
+        "produce_seconds": produce_cost,
+        "seconds": cost,
+        "completed": done,
+        "records_per_second": len(rows) / cost,
+        "mb_per_second": total_size / cost / 1024 / 1024,
+        "written": unit_log.written_num.value - base_written,
+        "dropped": unit_log.dropped_num.value - base_dropped,
+        "lost": unit_log.lost_num,
+        "max_lag": unit_log.max_lag.value,
+        # 回放线程落后于原始时间的最大秒数, 较大时说明生产端本身跟不上
+        "max_schedule_slip": max(slips) if slips else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="replay traffic captured by UnitLog(capture_filepath=...)")
+    parser.add_argument("capture_filepath")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed factor, 0 means as fast as possible")
+    parser.add_argument("--out-dir", default="./temp/replay")
+    parser.add_argument("--mode", choices=(MODE_PROCESS, MODE_THREAD),
+                        default=MODE_PROCESS)
+    parser.add_argument("--sink-queue-size", type=int, default=10000)
+    parser.add_argument("--sink-put-timeout", type=float, default=None,
+                        help="default: 0.5 in thread mode, 0 in process mode")
+    parser.add_argument("--max-open-sinks", type=int, default=256)
+    parser.add_argument("--no-priority", action="store_true",
+                        help="disable the priority lane")
+    args = parser.parse_args()
+
+    unit_log = UnitLog(
+        mode=args.mode, sink_queue_size=args.sink_queue_size,
+        sink_put_timeout=args.sink_put_timeout,
+        max_open_sinks=args.max_open_sinks,
+        priority_level=None if args.no_priority else logging.ERROR)
+    result = replay(args.capture_filepath, unit_log=unit_log,
+                    speed=args.speed, out_dir=args.out_dir)
+    for key, value in result.items():
+        if isinstance(value, float):
+            value = round(value, 4)
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+import sys
+import time
+import hashlib
+import threading
+from queue import Empty
+from collections import deque, OrderedDict
+
+try:
+    from queue import SimpleQueue
+except ImportError:  # Python 3.6
+    from queue import Queue as SimpleQueue
+
+
+class TracebackDeduper(object):
+    """ 按内容 hash 对异常堆栈去重: 窗口内第一次出现时写出完整堆栈,
+        之后只写 [traceback #a1b2c3 seen 512x]
+    """
+    # 超过该数量时清理过期的 hash
+    prune_size = 1024
+    # 引用中显示的 hash 前缀长度, 去重按完整 hash 判断, 前缀相同的不同堆栈不会被合并
+    ref_size = 6
+
+    def __init__(self, window=60.0):
+        self.window = window
+        # 完整 digest -> [窗口开始时间, 窗口内出现次数]
+        self._seen = {}
+
+    @classmethod
+    def digest(cls, exc_text) -> str:
+        return hashlib.blake2b(exc_text.encode("utf-8", "replace")).hexdigest()
+
+    def render(self, exc_text, now=None) -> str:
+        now = time.time() if now is None else now
+        digest = self.digest(exc_text)
+        ref = digest[:self.ref_size]
+        seen = self._seen.get(digest)
+        if seen is not None and now - seen[0] < self.window:
+            seen[1] += 1
+            return f"[traceback #{ref} seen {seen[1]}x]"
+        if seen is None and len(self._seen) >= self.prune_size:
+            self._seen = {k: v for k, v in self._seen.items()
+                          if now - v[0] < self.window}
+        self._seen[digest] = [now, 1]
+        return f"[traceback #{ref}]\n{exc_text}"
+
+
+class SinkWorker(object):
+    """ 每个 sink (console / 单个文件) 在写日志进程内拥有独立的有界队列和线程,
+        慢 sink 只会拖慢自己, 不会阻塞其它 sink;
+        priority 日志进入单独的队列, 总是先于普通日志写出
+    """
+
+    def __init__(self, writer, name, max_size=10000, lag_warn_seconds=1.0,
+                 on_emit=None, tail_size=0, dedup_window=0, on_drop=None):
+        """
+        :param on_drop: on_drop(sink, num), stop 超时后未写出的日志计为丢弃时调用
+        :param tail_size: 保留最近写出的日志条数, 供实时查询, 0 表示不保留
+        :param dedup_window: 异常堆栈去重的时间窗口 (秒), 0 表示每次都写出完整堆栈
+        """
+        self.writer = writer
+        self.name = name
+        self.max_size = max_size
+        self.lag_warn_seconds = lag_warn_seconds
+        self.on_emit = on_emit
+        self.on_drop = on_drop
+        self.stats = {
+            "written": 0,
+            "dropped": 0,
+            "depth": 0,
+            "max_depth": 0,
+            "last_lag": 0.0,
+            "max_lag": 0.0,
+            "priority_written": 0,
+            "priority_max_lag": 0.0,
+        }
+        self.tail = deque(maxlen=tail_size) if tail_size else None
+        self.deduper = TracebackDeduper(dedup_window) if dedup_window else None
+        self._queue = deque()
+        self._priority_queue = deque()
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)
+        self._not_full = threading.Condition(lock)
+        # 等待超时后标记为过载, 直接丢弃, 直到积压降到一半以下
+        self._overloaded = False
+        self._closed = False
+        # sink 线程在等待新日志, 没有正在写出的日志
+        self._idle = False
+        self._last_warn_time = 0.0
+        self._thread = threading.Thread(target=self._run,
+                                        name=f"unitlog-sink-{name}",
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def put(self, log_box, timeout=0) -> bool:
+        """ drop and count when the sink is full,
+            timeout: 队列满时最多等待的秒数, 让短时的突发流量不丢日志;
+                     持续阻塞的 sink 只会等待一次, 之后直接丢弃, 不会拖慢其它 sink
+        """
+        queue = self._priority_queue if log_box.priority else self._queue
+        with self._cond:
+            if self._closed:
+                self.stats["dropped"] += 1
+                return False
+            if len(queue) >= self.max_size and timeout and not self._overloaded:
+                self._not_full.wait_for(
+                    lambda: len(queue) < self.max_size or self._closed,
+                    timeout=timeout)
+            if len(queue) >= self.max_size:
+                self._overloaded = True
+                self.stats["dropped"] += 1
+                return False
+            queue.append(log_box)
+            depth = len(self._queue) + len(self._priority_queue)
+            if depth > self.stats["max_depth"]:
+                self.stats["max_depth"] = depth
+            self._cond.notify()
+        return True
+
+    def _next_box(self):
+        with self._cond:
+            while not self._queue and not self._priority_queue:
+                if self._closed:
+                    return None
+                self._idle = True
+                self._cond.wait()
+            self._idle = False
+            if self._priority_queue:
+                log_box = self._priority_queue.popleft()
+            else:
+                log_box = self._queue.popleft()
+            depth = len(self._queue) + len(self._priority_queue)
+            self.stats["depth"] = depth
+            if depth <= self.max_size // 2:
+                self._overloaded = False
+            self._not_full.notify()
+            return log_box
+
+    def _run(self):
+        while True:
+            log_box = self._next_box()
+            if log_box is None:
+                break
+            try:
+                self.writer.emit(self._render(log_box))
+            except Exception as e:
+                print(f"unitlog sink {self.name} emit failed: {e}",
+                      file=sys.stderr)
+                continue
+            self._record_lag(log_box)
+            if self.tail is not None:
+                self.tail.append(log_box)
+            if self.on_emit is not None:
+                self.on_emit(self, log_box)
+
+    def _render(self, log_box):
+        exc_text = log_box.exc_text
+        if exc_text is None:
+            return log_box.log_msg
+        if self.deduper is not None:
+            exc_text = self.deduper.render(exc_text, now=log_box.created_at)
+        return f"{log_box.log_msg}\n{exc_text}\n"
+
+    def _record_lag(self, log_box):
+        stats = self.stats
+        stats["written"] += 1
+        lag = time.time() - log_box.created_at
+        stats["last_lag"] = lag
+        if lag > stats["max_lag"]:
+            stats["max_lag"] = lag
+        if log_box.priority:
+            stats["priority_written"] += 1
+            if lag > stats["priority_max_lag"]:
+                stats["priority_max_lag"] = lag
+        if lag < self.lag_warn_seconds:
+            return
+        now = time.time()
+        if now - self._last_warn_time >= 5:
+            self._last_warn_time = now
+            print(f"unitlog sink {self.name} is lagging: "
+                  f"lag={round(lag, 3)}s depth={stats['depth']} "
+                  f"max_lag={round(stats['max_lag'], 3)}s "
+                  f"dropped={stats['dropped']}", file=sys.stderr)
+
+    def stop(self, timeout=None) -> int:
+        """ drain the pending records, then stop the thread;
+            超时还没写出的日志不再写出, 计为丢弃, 返回丢弃的条数
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            self._not_full.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        if not self._thread.is_alive():
+            return 0
+        with self._cond:
+            dropped = len(self._queue) + len(self._priority_queue)
+            self._queue.clear()
+            self._priority_queue.clear()
+            self.stats["dropped"] += dropped
+            self.stats["depth"] = 0
+        if dropped and self.on_drop is not None:
+            self.on_drop(self, dropped)
+        return dropped
+
+    def stop_if_idle(self) -> bool:
+        """ 没有积压也没有正在写出的日志时停止, 返回 True 后 sink 线程不会再调用 writer
+        """
+        with self._cond:
+            if self._queue or self._priority_queue or not self._idle:
+                return False
+            self._closed = True
+            self._cond.notify()
+            self._not_full.notify_all()
+        return True
+
+    def join(self, timeout=None) -> bool:
+        """ 等待 sink 线程退出, 返回是否已退出
+        """
+        self._thread.join(timeout=timeout)
+        return not self._thread.is_alive()
+
+
+# SinkPool 计数器在 counters 中的位置
+POOL_COUNTERS = ("open", "hits", "misses", "evictions", "reopens")
+_OPEN, _HITS, _MISSES, _EVICTIONS, _REOPENS = range(len(POOL_COUNTERS))
+
+
+class SinkPool(object):
+    """ 容量有限的 LRU sink 池, 超出容量时 flush 并关闭最久未使用的 sink,
+        再次用到时由 factory 以追加模式重新打开, 避免文件句柄耗尽
+    """
+
+    def __init__(self, capacity=256, close_timeout=3, counters=None,
+                 pending_size=10000, on_drop=None):
+        """
+        :param close_timeout: 关闭 sink 时等待剩余日志写出的秒数, 超时未写出的计为丢弃
+        :param counters: 长度为 len(POOL_COUNTERS) 的计数器, 传入共享数组时
+                         其它进程不经过写日志进程也能读取; 只在池锁内更新
+        :param pending_size: 每个正在关闭的 key 最多暂存的日志条数, 超出时丢弃
+        :param on_drop: on_drop(sink, num), 暂存的日志没能写进重新打开的 sink 时调用,
+                        重新打开失败时 sink 为 None
+        """
+        assert capacity > 0, "capacity must be positive"
+        self.capacity = capacity
+        self.close_timeout = close_timeout
+        self.pending_size = pending_size
+        self.on_drop = on_drop
+        if counters is None:
+            counters = [0] * len(POOL_COUNTERS)
+        # 重启后的写日志进程沿用之前的计数, 只重置打开数
+        counters[_OPEN] = 0
+        self.counters = counters
+        self._sinks = OrderedDict()
+        self._opened_keys = set()
+        # 被淘汰、正在后台关闭的 sink 的 key
+        self._closing = set()
+        # 正在关闭的 key 上新到的日志: key -> (factory, [log_box]),
+        # 关闭完成后重新打开 sink 按顺序写出
+        self._pending = {}
+        self._close_queue = SimpleQueue()
+        self._closer = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sinks)
+
+    def __contains__(self, key):
+        return key in self._sinks
+
+    def values(self) -> list:
+        with self._lock:
+            return list(self._sinks.values())
+
+    def stats(self) -> dict:
+        return self.counters_stats(self.counters, self.capacity)
+
+    @classmethod
+    def counters_stats(cls, counters, capacity) -> dict:
+        stats = dict(zip(POOL_COUNTERS, counters))
+        stats["capacity"] = capacity
+        return stats
+
+    def put(self, key, log_box, factory, timeout=0) -> bool:
+        """
+        :param factory: factory(reopen) -> started SinkWorker,
+                        reopen 为 True 时说明该 sink 之前被淘汰过
+        :param timeout: 见 SinkWorker.put
+        """
+        with self._lock:
+            sink = self._sinks.get(key)
+            if sink is not None:
+                self.counters[_HITS] += 1
+                self._sinks.move_to_end(key)
+            elif key in self._closing:
+                # 同一个 key 被淘汰后还没关闭完, 先暂存, 关闭完成后再按顺序写出;
+                # 不等待关闭, 分发线程 (包括高优先级通道) 不会被卡住的 sink 阻塞
+                pending = self._pending.setdefault(key, (factory, []))[1]
+                if len(pending) >= self.pending_size:
+                    return False
+                pending.append(log_box)
+                return True
+            else:
+                sink = self._open(key, factory)
+        # 刚用过的 sink 排在 LRU 末尾, 不会被另一个分发线程马上淘汰;
+        # 在锁外 put, 等待队列空间时不阻塞另一个分发线程
+        return sink.put(log_box, timeout=timeout)
+
+    def _open(self, key, factory):
+        """ 在池锁内调用
+        """
+        self.counters[_MISSES] += 1
+        reopen = key in self._opened_keys
+        if reopen:
+            self.counters[_REOPENS] += 1
+        while len(self._sinks) >= self.capacity:
+            self._evict()
+        sink = factory(reopen)
+        self._sinks[key] = sink
+        self._opened_keys.add(key)
+        self.counters[_OPEN] = len(self._sinks)
+        return sink
+
+    def _evict(self):
+        """ 在池锁内调用, 还有日志没写完的 sink 由后台的 closer 线程 flush 并关闭,
+            被卡住的 sink 不会阻塞分发线程
+        """
+        key, sink = self._sinks.popitem(last=False)
+        self.counters[_EVICTIONS] += 1
+        self.counters[_OPEN] = len(self._sinks)
+        if sink.stop_if_idle():
+            # 大多数被淘汰的 sink 是空闲的, 直接关闭, 不需要等待 sink 线程退出
+            self._close_writer(sink)
+            return
+        self._closing.add(key)
+        if self._closer is None:
+            self._closer = threading.Thread(target=self._run_closer,
+                                            name="unitlog-sink-closer",
+                                            daemon=True)
+            self._closer.start()
+        self._close_queue.put((key, sink))
+
+    def _run_closer(self):
+        while True:
+            item = self._close_queue.get()
+            if item is None:
+                break
+            self._finish_closing(*item)
+
+    def _finish_closing(self, key, sink):
+        try:
+            self._close_sink(sink)
+        finally:
+            with self._lock:
+                self._closing.discard(key)
+                self._flush_pending(key)
+
+    def _flush_pending(self, key):
+        """ 在池锁内调用, 之后到达的日志直接进入重新打开的 sink, 顺序不变
+        """
+        factory, pending = self._pending.pop(key, (None, None))
+        if not pending:
+            return
+        try:
+            sink = self._open(key, factory)
+        except Exception as e:
+            print(f"unitlog reopen sink {key} failed: {e}", file=sys.stderr)
+            if self.on_drop is not None:
+                self.on_drop(None, len(pending))
+            return
+        dropped = 0
+        for log_box in pending:
+            if not sink.put(log_box):
+                dropped += 1
+        if dropped and self.on_drop is not None:
+            self.on_drop(sink, dropped)
+
+    def _close_sink(self, sink):
+        sink.stop(timeout=self.close_timeout)
+        # sink 线程可能还卡在写入, 退出后才能关闭, 否则正在写的日志会写到已关闭的文件
+        if not sink.join(timeout=self.close_timeout):
+            print(f"unitlog sink {sink.name} is still blocked in emit, "
+                  f"leave its writer open", file=sys.stderr)
+            return
+        self._close_writer(sink)
+
+    @classmethod
+    def _close_writer(cls, sink):
+        try:
+            sink.writer.close()
+        except Exception as e:
+            print(f"unitlog close sink {sink.name} failed: {e}",
+                  file=sys.stderr)
+
+    def close(self):
+        """ 分发线程退出后调用
+        """
+        with self._lock:
+            closer = self._closer
+        if closer is not None:
+            # 先等后台关闭完成, 暂存的日志在重新打开的 sink 中写出
+            self._close_queue.put(None)
+            closer.join()
+        # 重新打开时又淘汰的 sink, closer 已经退出, 在这里关闭
+        while True:
+            try:
+                item = self._close_queue.get(block=False)
+            except Empty:
+                break
+            if item is not None:
+                self._finish_closing(*item)
+        with self._lock:
+            sinks = list(self._sinks.values())
+            self._sinks.clear()
+            self.counters[_OPEN] = 0
+        for sink in sinks:
+            self._close_sink(sink)
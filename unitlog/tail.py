@@ -0,0 +1,215 @@
+"""
+写日志进程内的实时日志: 每个 sink 保留最近的日志 (SinkWorker.tail),
+通过本地 socket 提供查询和订阅, 看实时日志不再需要读日志文件
+"""
+import os
+import sys
+import logging
+import threading
+from queue import Queue, Full, Empty
+from multiprocessing.connection import Listener, Client
+
+
+def tail_item(sink_name, log_box) -> dict:
+    return {
+        "sink": sink_name,
+        "logger": log_box.logger_name,
+        "levelno": log_box.levelno,
+        "levelname": logging.getLevelName(log_box.levelno),
+        "created": log_box.created_at,
+        "msg": log_box.log_msg,
+        # 异常堆栈去重模式下堆栈不在 msg 中
+        "exc_text": log_box.exc_text,
+    }
+
+
+def match_tail(sink_name, log_box, logger_name=None, level=logging.NOTSET,
+               sink=None) -> bool:
+    """
+    :param logger_name: 匹配该 logger 及其子 logger
+    :param sink: sink 名称 (例: file-./logs/a.log) 或日志文件路径
+    """
+    if log_box.levelno < level:
+        return False
+    if logger_name and log_box.logger_name != logger_name \
+            and not log_box.logger_name.startswith(logger_name + "."):
+        return False
+    if sink and sink != sink_name and sink_name.split("-", 1)[-1] != sink:
+        return False
+    return True
+
+
+class _Subscriber(object):
+
+    def __init__(self, conn, filters, queue_size):
+        self.conn = conn
+        self.filters = filters
+        self.queue = Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            # 消费慢的订阅者只丢自己的日志, 不阻塞 sink 线程
+            self.dropped += 1
+
+
+class TailServer(object):
+    """ 运行在写日志进程内
+        请求: ("tail", filters, limit) / ("subscribe", filters) / ("stats", )
+    """
+
+    def __init__(self, address, authkey=None, sinks=None, stats=None,
+                 subscriber_queue_size=10000, poll_interval=1.0):
+        """
+        :param sinks: sinks() -> [SinkWorker, ...]
+        :param stats: stats() -> dict
+        :param poll_interval: 没有新日志时检查订阅连接是否断开的间隔 (秒)
+        """
+        self.address = address
+        self.authkey = authkey
+        self.sinks = sinks
+        self.stats = stats
+        self.subscriber_queue_size = subscriber_queue_size
+        self.poll_interval = poll_interval
+        self.subscribers = []
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def start(self):
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            # 上一个写日志进程异常退出时留下的 socket 文件
+            os.unlink(self.address)
+        self._listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._serve, name="unitlog-tail-server",
+                         daemon=True).start()
+        return self
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+
+    def publish(self, sink_name, log_box):
+        for subscriber in self.subscribers:
+            if match_tail(sink_name, log_box, **subscriber.filters):
+                subscriber.offer(tail_item(sink_name, log_box))
+
+    def _serve(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:  # listener closed
+                break
+            except Exception as e:  # auth failure etc.
+                print(f"unitlog tail server accept failed: {e}",
+                      file=sys.stderr)
+                continue
+            threading.Thread(target=self._handle, args=(conn, ),
+                             name="unitlog-tail-conn", daemon=True).start()
+
+    def query(self, limit=100, **filters) -> list:
+        items = []
+        for sink in self.sinks():
+            if sink.tail is None:
+                continue
+            for log_box in list(sink.tail):
+                if match_tail(sink.name, log_box, **filters):
+                    items.append(tail_item(sink.name, log_box))
+        items.sort(key=lambda item: item["created"])
+        return items[-limit:] if limit else items
+
+    def _handle(self, conn):
+        try:
+            request = conn.recv()
+            command = request[0]
+            if command == "tail":
+                _, filters, limit = request
+                conn.send(self.query(limit=limit, **filters))
+            elif command == "stats":
+                conn.send(self.stats())
+            elif command == "subscribe":
+                self._subscribe(conn, request[1])
+            else:
+                conn.send(ValueError(f"unknown tail command: {command}"))
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            print(f"unitlog tail server failed: {e}", file=sys.stderr)
+        finally:
+            conn.close()
+
+    def _subscribe(self, conn, filters):
+        subscriber = _Subscriber(conn, filters, self.subscriber_queue_size)
+        with self._lock:
+            # copy on write, publish 遍历时不需要加锁
+            self.subscribers = self.subscribers + [subscriber]
+        try:
+            conn.send("subscribed")
+            while True:
+                try:
+                    item = subscriber.queue.get(timeout=self.poll_interval)
+                except Empty:
+                    # 订阅方不会再发送数据, 可读说明连接已经断开
+                    if conn.poll():
+                        break
+                    continue
+                conn.send(item)
+        finally:
+            with self._lock:
+                self.subscribers = [s for s in self.subscribers
+                                    if s is not subscriber]
+
+
+def tail_request(address, authkey, request):
+    with Client(address, authkey=authkey) as conn:
+        conn.send(request)
+        response = conn.recv()
+    if isinstance(response, Exception):
+        raise response
+    return response
+
+
+class TailSubscription(object):
+    """ 订阅新写出的日志, 连接建立后才返回, 之后写出的日志都不会漏掉
+
+        with unit_log.subscribe(level=logging.ERROR) as subscription:
+            for item in subscription:
+                ...
+    """
+
+    def __init__(self, address, authkey, filters):
+        self.conn = Client(address, authkey=authkey)
+        self.conn.send(("subscribe", filters))
+        reply = self.conn.recv()
+        if reply != "subscribed":
+            self.conn.close()
+            if isinstance(reply, Exception):
+                raise reply
+            raise ConnectionError(f"unexpected tail subscribe reply: "
+                                  f"{reply!r}")
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> dict:
+        try:
+            return self.conn.recv()
+        except (EOFError, OSError):
+            raise StopIteration
+
+    def recv(self, timeout=None):
+        """ 超时返回 None
+        """
+        if timeout is not None and not self.conn.poll(timeout):
+            return None
+        return self.conn.recv()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,107 @@
+import os
+import time
+import string
+import threading
+
+# 由写日志进程根据日志时间计算的内置字段
+TIME_FIELDS = {
+    "date": "%Y-%m-%d",
+    "hour": "%H",
+    "month": "%Y-%m",
+}
+# 由打日志一侧从 record 中取值的内置字段
+RECORD_FIELDS = {
+    "logger": "name",
+    "levelname": "levelname",
+}
+MISSING_VALUE = "unknown"
+
+
+class PathTemplate(object):
+    """ 日志文件路径模板, 例: ./logs/{tenant}/{date}.log
+
+        非内置字段从 record 的 extra 中取值, 缺失时使用 "unknown"
+    """
+
+    def __init__(self, template):
+        self.template = template
+        fields = []
+        for _, field, _, _ in string.Formatter().parse(template):
+            if field is None:
+                continue
+            if not field.isidentifier():
+                raise ValueError(f"invalid field {{{field}}} in log path "
+                                 f"template: {template}")
+            if field not in fields:
+                fields.append(field)
+        self.fields = tuple(fields)
+        self.record_fields = tuple(f for f in self.fields
+                                   if f not in TIME_FIELDS)
+        self.time_fields = tuple(f for f in self.fields if f in TIME_FIELDS)
+
+    @property
+    def is_dynamic(self) -> bool:
+        return bool(self.fields)
+
+    @property
+    def static_dir(self) -> str:
+        """ 模板中第一个字段之前的目录, 可以提前创建
+        """
+        prefix = self.template.split("{", 1)[0]
+        return os.path.dirname(prefix)
+
+    def record_values(self, record) -> dict:
+        values = {}
+        for field in self.record_fields:
+            value = getattr(record, RECORD_FIELDS.get(field, field), None)
+            if value is not None:
+                values[field] = value
+        return values
+
+    @classmethod
+    def _safe_value(cls, value) -> str:
+        # 字段值不能跳出模板指定的目录
+        value = str(value).replace(os.sep, "_")
+        if os.altsep:
+            value = value.replace(os.altsep, "_")
+        if value in ("", ".", ".."):
+            return "_"
+        return value
+
+    def resolve(self, values: dict, created: float) -> str:
+        kwargs = {field: self._safe_value(values.get(field, MISSING_VALUE))
+                  for field in self.record_fields}
+        if self.time_fields:
+            local_time = time.localtime(created)
+            for field in self.time_fields:
+                kwargs[field] = time.strftime(TIME_FIELDS[field], local_time)
+        return self.template.format(**kwargs)
+
+
+_TEMPLATE_CACHE = {}
+_TEMPLATE_CACHE_LOCK = threading.Lock()
+
+
+def _reset_lock():
+    # fork 时其它线程可能正持有锁
+    global _TEMPLATE_CACHE_LOCK
+    _TEMPLATE_CACHE_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_lock)
+
+
+def compile_path_template(template) -> PathTemplate:
+    path_template = _TEMPLATE_CACHE.get(template)
+    if path_template is None:
+        with _TEMPLATE_CACHE_LOCK:
+            path_template = _TEMPLATE_CACHE.get(template)
+            if path_template is None:
+                path_template = PathTemplate(template)
+                _TEMPLATE_CACHE[template] = path_template
+    return path_template
+
+
+def is_path_template(log_filepath) -> bool:
+    return compile_path_template(log_filepath).is_dynamic
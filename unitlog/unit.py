@@ -3,12 +3,29 @@ import sys
 import inspect
 import atexit
 import logging
+import weakref
+import threading
 import traceback
 from queue import Empty
 import multiprocessing as mp
+from multiprocessing import queues as mp_queues
+from multiprocessing.connection import wait, arbitrary_address, default_family
 from multiprocessing.synchronize import Event
 
-from unitlog.handlers import LogBox, UnitFileHandler, UnitConsoleHandler
+from unitlog.formatter import UnitFormatter
+from unitlog.handlers import (LogBox, UnitFileHandler, UnitConsoleHandler,
+                              UnitColumnarHandler)
+from unitlog.capture import TrafficCapture
+from unitlog.columnar import PoxyColumnarLogWriter
+from unitlog.logger import install_unit_logger
+from unitlog.tail import TailServer, TailSubscription, tail_request
+from unitlog.sink import SinkWorker, SinkPool, POOL_COUNTERS
+from unitlog.template import compile_path_template
+
+try:
+    from queue import SimpleQueue
+except ImportError:  # Python 3.6
+    from queue import Queue as SimpleQueue
 
 
 
@@ -45,72 +62,649 @@ class PoxyFileLogWriter(PoxyConsoleLogWriter):
         super().__init__(stream=open(log_filepath, file_mode))
 
 
-class UnitLog(object):
+class PoxyStdoutLogWriter(PoxyConsoleLogWriter):
+
+    def close(self):
+        # stdout 不归写日志进程所有, 只 flush 不关闭
+        self.stream.flush()
+
+
+class _RegisterCache(object):
+    """ 一次注册过程中共用的 handler, 以及已创建的目录、已写过 Log_filename 的文件
+    """
 
     def __init__(self):
+        self.handlers = {}
+        self.dirs = set()
+        self.log_filepaths = set()
+
+
+MODE_PROCESS = "process"
+MODE_THREAD = "thread"
+THREAD_SINK_PUT_TIMEOUT = 0.5
+
+
+class UnitLog(object):
+
+    def __init__(self, sink_queue_size=10000, sink_lag_warn_seconds=1.0,
+                 priority_level=logging.ERROR, max_open_sinks=256,
+                 mode=MODE_PROCESS, sink_put_timeout=None, tail_size=0,
+                 tail_address=None, tail_authkey=None,
+                 traceback_dedup_window=0, capture_filepath=None):
+        """
+        :param priority_level: 达到该级别的日志走高优先级通道, None 表示关闭
+        :param max_open_sinks: 写日志进程同时打开的 sink (文件句柄 + 线程) 上限
+        :param mode: process: 独立的写日志进程;
+                     thread: 单进程应用使用进程内的写日志线程, 日志对象不经过序列化,
+                             应用第一次 fork 时自动切换为 process 模式
+        :param sink_put_timeout: sink 队列满时分发线程最多等待的秒数, 之后丢弃并计数;
+                                 默认 thread 模式等待 THREAD_SINK_PUT_TIMEOUT 秒 (生产者不经过序列化,
+                                 突发流量比 sink 写得快), process 模式不等待, 慢 sink 不会拖慢分发
+        :param tail_size: 写日志进程为每个 sink 保留的最近日志条数, 大于 0 时可以通过
+                          tail / subscribe / writer_stats 查询实时日志, 不需要读日志文件
+        :param tail_address: 查询实时日志的本地地址, 默认自动生成
+        :param tail_authkey: 默认使用 multiprocessing 的进程 authkey, 其它进程查询时需要指定
+        :param traceback_dedup_window: 大于 0 时, 同一个 sink 内内容相同的异常堆栈在该时间窗口 (秒)
+                                       内只写出一次完整堆栈, 之后写 [traceback #a1b2c3 seen 512x]
+        :param capture_filepath: 写日志进程把流量形态 (时间、大小、级别、sink、pid/tid,
+                                 不含日志内容) 记录到该文件, 用 unitlog.replay 回放
+        """
+        assert mode in (MODE_PROCESS, MODE_THREAD), f"unknown mode: {mode}"
+        self.mode = mode
         self.started: Event = mp.Event()
         self.stopped: Event = mp.Event()
         self.log_num = mp.Value('i', 0)
+        # 写日志进程的投递统计, 用于进程异常退出后计算丢失的日志数;
+        # 不带进程锁: 写日志进程持锁时被 kill, 锁永远不会释放, watchdog 读取时会卡死.
+        # 只由写日志进程在 _counter_lock 内更新, 其它进程直接读取
+        self.dispatched_num = mp.RawValue('q', 0)
+        self.written_num = mp.RawValue('q', 0)
+        self.dropped_num = mp.RawValue('q', 0)
+        # 写出时的最大延迟 (秒), 从打日志到写出
+        self.max_lag = mp.RawValue('d', 0.0)
+        # sink 池的打开数、命中、淘汰等计数, 由写日志进程在池锁内更新
+        self.sink_pool_counters = mp.RawArray('q', len(POOL_COUNTERS))
+        self.lost_num = 0
+        self.restart_num = 0
         self.worker = None
+        self.watchdog = None
         self.bus_queue = None
-        self._proxy_handler_map = {}
-
-    def _init_proxy_handler(self, log_box: LogBox) -> PoxyConsoleLogWriter:
-        hkey = f"{log_box.log_type}-{log_box.log_filepath}"
-        if hkey not in self._proxy_handler_map:
-            if log_box.log_type == "console":
-                self._proxy_handler_map[hkey] = PoxyConsoleLogWriter()
-            elif log_box.log_type == "file":
-                abs_log_filepath = os.path.abspath(log_box.log_filepath)
-                dir_path = os.path.dirname(abs_log_filepath)
-                if not os.path.exists(dir_path):
-                    os.makedirs(dir_path, exist_ok=True)
-
-                self._proxy_handler_map[hkey] = PoxyFileLogWriter(
-                    log_filepath=abs_log_filepath,
-                    file_mode=log_box.file_mode
+        self.priority_queue = None
+        self.priority_level = priority_level
+        self.sink_queue_size = sink_queue_size
+        self.sink_lag_warn_seconds = sink_lag_warn_seconds
+        self.sink_put_timeout = sink_put_timeout
+        self.max_open_sinks = max_open_sinks
+        self.tail_size = tail_size
+        self.tail_address = None
+        if tail_size:
+            self.tail_address = tail_address or arbitrary_address(
+                default_family)
+        # Listener 的 authkey 为 None 时不做认证, 本机任何用户都能连上读日志
+        self.tail_authkey = (bytes(mp.current_process().authkey)
+                             if tail_authkey is None else tail_authkey)
+        self.traceback_dedup_window = traceback_dedup_window
+        self.capture_filepath = capture_filepath
+        # 只在写日志进程内创建
+        self.sink_pool: SinkPool = None
+        self.tail_server: TailServer = None
+        self.capture: TrafficCapture = None
+        self._counter_lock: threading.Lock = None
+        self._force_append_mode = False
+        self._handlers = weakref.WeakSet()
+        self._switching = False
+        # caller_info -> (console formatter, file formatter)
+        self._formatters = {}
+        # 启动写日志进程 (线程) 的进程, fork 出的子进程只是生产者
+        self._owner_pid = os.getpid()
+        _UNIT_LOGS.add(self)
+
+    # 只属于打日志进程 (或写日志线程) 的状态, spawn / forkserver 启动写日志进程时
+    # UnitLog 会被 pickle, 这些状态既不能也不需要传给写日志进程
+    _PROCESS_LOCAL_STATE = ("_handlers", "_formatters", "watchdog", "worker",
+                            "sink_pool", "tail_server", "capture",
+                            "_counter_lock")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self._PROCESS_LOCAL_STATE:
+            state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._handlers = weakref.WeakSet()
+        self._formatters = {}
+
+    def _new_proxy_writer(self, log_box: LogBox, log_filepath,
+                          reopen=False):
+        if log_box.log_type == "console":
+            return PoxyStdoutLogWriter()
+        elif log_box.log_type in ("file", "columnar"):
+            abs_log_filepath = os.path.abspath(log_filepath)
+            dir_path = os.path.dirname(abs_log_filepath)
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path, exist_ok=True)
+
+            # 被 LRU 淘汰后重新打开, 或重启后的写日志进程, 不能再用 "w" 清空之前写的日志
+            append = reopen or self._force_append_mode
+            file_mode = "a" if append else log_box.file_mode
+            if log_box.log_type == "columnar":
+                return PoxyColumnarLogWriter(
+                    log_filepath=abs_log_filepath, columns=log_box.columns,
+                    file_mode=file_mode
                 )
-            else:
-                raise TypeError(f"Unsupported log type: {log_box.log_type}")
-        return self._proxy_handler_map[hkey]
+            return PoxyFileLogWriter(
+                log_filepath=abs_log_filepath,
+                file_mode=file_mode
+            )
+        raise TypeError(f"Unsupported log type: {log_box.log_type}")
+
+    def _put_to_proxy_handler(self, log_box: LogBox) -> bool:
+        log_filepath = log_box.log_filepath
+        if log_box.path_values is not None:
+            log_filepath = compile_path_template(log_filepath).resolve(
+                log_box.path_values, log_box.created_at)
+        hkey = f"{log_box.log_type}-{log_filepath}"
+        if self.capture is not None:
+            self.capture.record(hkey, log_box)
+
+        def _new_sink(reopen) -> SinkWorker:
+            return SinkWorker(
+                writer=self._new_proxy_writer(log_box, log_filepath,
+                                              reopen=reopen),
+                name=hkey, max_size=self.sink_queue_size,
+                lag_warn_seconds=self.sink_lag_warn_seconds,
+                on_emit=self._on_sink_emit, on_drop=self._on_sink_drop,
+                tail_size=0 if log_box.log_type == "columnar" else self.tail_size,
+                dedup_window=self.traceback_dedup_window
+            ).start()
+
+        put_timeout = self.sink_put_timeout
+        if put_timeout is None:
+            put_timeout = (THREAD_SINK_PUT_TIMEOUT if self.mode == MODE_THREAD
+                           else 0)
+        return self.sink_pool.put(hkey, log_box, _new_sink,
+                                  timeout=put_timeout)
+
+    def _on_sink_emit(self, sink: SinkWorker, log_box: LogBox):
+        lag = sink.stats["last_lag"]
+        with self._counter_lock:
+            self.written_num.value += 1
+            if lag > self.max_lag.value:
+                self.max_lag.value = lag
+        tail_server = self.tail_server
+        if (tail_server is not None and tail_server.subscribers
+                and log_box.log_type != "columnar"):
+            tail_server.publish(sink.name, log_box)
+        if os.environ.get("ENV-TEST", "prod") == "test":
+            # sink 线程并发累加, 需要加锁
+            with self.log_num.get_lock():
+                self.log_num.value += 1
+
+    def _on_sink_drop(self, sink: SinkWorker, num):
+        # sink 关闭超时未写出的日志, 或淘汰时暂存没能写出的日志, 已经被分发线程计入 dispatched
+        with self._counter_lock:
+            self.dropped_num.value += num
 
-    def listening_log_msg(self, bus_queue):
+    def _dispatch_log_msg(self, bus_queue):
         while True:
-            self.started.set()
             try:
                 log_box: LogBox = bus_queue.get(timeout=0.1)
             except Empty:
-                if self.stopped.is_set():
+                if self.stopped.is_set() or self._owner_exited():
                     break
                 continue
             except KeyboardInterrupt:
                 continue
+            if log_box is None:  # thread 模式切换为 process 模式
+                break
             try:
-                handler = self._init_proxy_handler(log_box)
-
-                handler.emit(log_box.log_msg)
-                if os.environ.get("ENV-TEST", "prod") == "test":
-                    self.log_num.value += 1
+                with self._counter_lock:
+                    self.dispatched_num.value += 1
+                # 只负责路由, 真正的写入在各 sink 自己的线程里
+                if not self._put_to_proxy_handler(log_box):
+                    with self._counter_lock:
+                        self.dropped_num.value += 1
             except Exception as e:
                 print(f"unexpect exception: {e}\n "
                       f"{traceback.format_exc()}")
+
+    def _owner_exited(self) -> bool:
+        """ 写日志进程的父进程已经退出 (例: 被 kill 或 os._exit), 不会再有人设置 stopped
+        """
+        if os.getpid() == self._owner_pid:  # thread 模式
+            return False
+        parent_process = getattr(mp, "parent_process", None)
+        parent = parent_process() if parent_process is not None else None
+        if parent is not None:
+            return not parent.is_alive()
+        return os.getppid() != self._owner_pid
+
+    def listening_log_msg(self, bus_queue, priority_queue=None,
+                          restarted=False):
+        # 分发线程和各 sink 线程共用, 只在写日志进程内有效
+        self._counter_lock = threading.Lock()
+        self.sink_pool = SinkPool(capacity=self.max_open_sinks,
+                                  counters=self.sink_pool_counters,
+                                  pending_size=self.sink_queue_size,
+                                  on_drop=self._on_sink_drop)
+        self._force_append_mode = restarted
+        if self.capture_filepath:
+            self.capture = TrafficCapture(
+                self.capture_filepath, file_mode="a" if restarted else "w")
+        if self.tail_size:
+            self.tail_server = TailServer(
+                self.tail_address, authkey=self.tail_authkey,
+                sinks=self.sink_pool.values, stats=self._writer_stats).start()
+        priority_thread = None
+        if priority_queue is not None:
+            # 高优先级通道有独立的分发线程, 不会排在 bus_queue 积压的日志后面
+            priority_thread = threading.Thread(
+                target=self._dispatch_log_msg, args=(priority_queue, ),
+                name="unitlog-priority-dispatcher", daemon=True)
+            priority_thread.start()
+        self.started.set()
+        self._dispatch_log_msg(bus_queue)
+        if priority_thread is not None:
+            priority_thread.join()
+        if self.tail_server is not None:
+            self.tail_server.close()
+        self.sink_pool.close()
+        if self.capture is not None:
+            self.capture.close()
         if os.environ.get("ENV-TEST", "prod") == "test":
-            print(f"all log num: {self.log_num.value}")
+            print(f"all log num: {self.log_num.value}, "
+                  f"sink pool: {self.sink_pool.stats()}")
+
+    def _shared_stats(self) -> dict:
+        return {
+            "dispatched": self.dispatched_num.value,
+            "written": self.written_num.value,
+            "dropped": self.dropped_num.value,
+            "max_lag": self.max_lag.value,
+            "sink_pool": self.sink_pool_stats(),
+        }
+
+    def _writer_stats(self) -> dict:
+        stats = self._shared_stats()
+        stats["sinks"] = {sink.name: dict(sink.stats)
+                          for sink in self.sink_pool.values()}
+        return stats
+
+    def sink_pool_stats(self) -> dict:
+        """ sink 池的打开数、命中、未命中、淘汰和重新打开次数, 不需要开启 tail
+        """
+        return SinkPool.counters_stats(self.sink_pool_counters,
+                                       self.max_open_sinks)
+
+    def _tail_request(self, request):
+        assert self.tail_address, "tail is disabled, set UnitLog(tail_size=...)"
+        return tail_request(self.tail_address, self.tail_authkey, request)
+
+    def tail(self, logger_name=None, level=logging.NOTSET, sink=None,
+             limit=100) -> list:
+        """ 查询写日志进程中最近写出的日志, 按时间排序
+        :param logger_name: 匹配该 logger 及其子 logger
+        :param sink: sink 名称 (例: file-./logs/a.log) 或日志文件路径
+        """
+        filters = dict(logger_name=logger_name, level=level, sink=sink)
+        return self._tail_request(("tail", filters, limit))
+
+    def subscribe(self, logger_name=None, level=logging.NOTSET,
+                  sink=None) -> TailSubscription:
+        """ 订阅之后写出的日志, 参数同 tail
+        """
+        assert self.tail_address, "tail is disabled, set UnitLog(tail_size=...)"
+        filters = dict(logger_name=logger_name, level=level, sink=sink)
+        return TailSubscription(self.tail_address, self.tail_authkey, filters)
+
+    def writer_stats(self) -> dict:
+        """ 写日志进程的投递统计、sink 池命中率以及各 sink 的积压和延迟;
+            各 sink 的统计 (sinks) 需要开启 tail, 其余统计总是可用
+        """
+        if not self.tail_address:
+            return self._shared_stats()
+        return self._tail_request(("stats", ))
+
+    def _new_queue(self):
+        if self.mode == MODE_THREAD:
+            return SimpleQueue()
+        return mp.Queue()
+
+    def _start_writer(self, restarted=False):
+        self._owner_pid = os.getpid()
+        args = (self.bus_queue, self.priority_queue, restarted)
+        if self.mode == MODE_THREAD:
+            self.worker = threading.Thread(target=self.listening_log_msg,
+                                           args=args, name="unitlog-writer",
+                                           daemon=True)
+        else:
+            self.worker = mp.Process(target=self.listening_log_msg,
+                                     args=args, daemon=True)
+        self.worker.start()
+        if not self.started.wait(timeout=3):
+            raise ValueError("unit log process is not started")
+
+    def _start_watchdog(self):
+        self.watchdog = threading.Thread(target=self._watch_writer,
+                                         name="unitlog-watchdog",
+                                         daemon=True)
+        self.watchdog.start()
+
+    def stop(self, timeout=3):
+        """ thread 模式下会等待写日志线程写完剩余日志;
+            fork 出的子进程中只把本进程缓冲的日志发送完, 不会停止共用的写日志进程
+        """
+        if os.getpid() != self._owner_pid:
+            self._flush_queues()
+            return
+        self.stopped.set()
+        if self.mode == MODE_THREAD and self.worker is not None:
+            self.worker.join(timeout=timeout)
+
+    def _before_fork(self):
+        """ thread 模式下 fork 前停止写日志线程, 把所有 handler 切换到进程间队列
+        """
+        if (self.mode != MODE_THREAD or self.worker is None
+                or self._switching or self.stopped.is_set()):
+            return
+        self._switching = True
+        old_queues = (self.bus_queue, self.priority_queue)
+        self.mode = MODE_PROCESS
+        self.bus_queue = self._new_queue()
+        if self.priority_queue is not None:
+            self.priority_queue = self._new_queue()
+        for handler in list(self._handlers):
+            handler.bus_queue = self.bus_queue
+            if handler.priority_queue is not None:
+                handler.priority_queue = self.priority_queue
+
+        for old_queue in old_queues:
+            if old_queue is not None:
+                old_queue.put(None)
+        self.worker.join()
+        # 切换前后其它线程刚放进旧队列的日志, 转移到新队列;
+        # 排空之后才放进旧队列的日志, 由 handler 发现队列已被换掉后自己转移
+        for old_queue, new_queue in zip(old_queues, (self.bus_queue,
+                                                     self.priority_queue)):
+            while old_queue is not None:
+                try:
+                    log_box = old_queue.get_nowait()
+                except Empty:
+                    break
+                if log_box is not None:
+                    new_queue.put(log_box)
+
+    def _after_fork_in_parent(self):
+        if not self._switching:
+            return
+        # 在 fork 完成后再启动写日志进程, 避免在 fork hook 中嵌套 fork
+        self._switching = False
+        self._start_writer(restarted=True)
+        self._start_watchdog()
+
+    def _after_fork_in_child(self):
+        """ 子进程只复制了 fork 的线程, 父进程 feeder 线程持有的锁和还没发送的缓冲
+            都处于不确定状态, 不重置的话子进程打日志可能卡死或重复发送父进程的日志
+        """
+        self._switching = False
+        for queue in (self.bus_queue, self.priority_queue):
+            if isinstance(queue, mp_queues.Queue):
+                # noinspection PyProtectedMember
+                queue._after_fork()
+        # watchdog 的统计只属于父进程
+        self.lost_num = 0
+        self.restart_num = 0
+
+    def _flush_queues(self):
+        for queue in (self.bus_queue, self.priority_queue):
+            if isinstance(queue, mp_queues.Queue):
+                queue.close()
+                queue.join_thread()
+
+    @classmethod
+    def _release_queue_reader(cls, queue):
+        """ 读锁只有写日志进程会持有, 进程被 kill 时可能来不及释放,
+            不处理的话新的写日志进程会永远拿不到日志
+        """
+        if queue is None:
+            return
+        # noinspection PyProtectedMember
+        rlock = queue._rlock
+        # 拿不到锁说明被已退出的进程持有, 两种情况都只需要 release 一次
+        rlock.acquire(block=False)
+        rlock.release()
+
+    def _count_lost_records(self) -> int:
+        """ 已从队列取出但还没写出的日志, 随写日志进程一起丢失
+        """
+        lost = (self.dispatched_num.value - self.written_num.value
+                - self.dropped_num.value - self.lost_num)
+        lost = max(lost, 0)
+        self.lost_num += lost
+        return lost
+
+    def _restart_writer(self):
+        exitcode = self.worker.exitcode
+        lost = self._count_lost_records()
+        self._release_queue_reader(self.bus_queue)
+        self._release_queue_reader(self.priority_queue)
+        self.started.clear()
+        self._start_writer(restarted=True)
+        self.restart_num += 1
+        print(f"unitlog writer process died (exitcode={exitcode}), "
+              f"restarted as pid {self.worker.pid}, "
+              f"{lost} in-flight records lost", file=sys.stderr)
+
+    def _watch_writer(self):
+        """ 不占用打日志的热路径, 只等待写日志进程的 sentinel
+        """
+        while not self.stopped.is_set():
+            wait([self.worker.sentinel], timeout=1)
+            # 解释器退出时 multiprocessing 会 terminate daemon 写日志进程, 不能再重启
+            if sys.is_finalizing() or _EXITING.is_set():
+                break
+            if self.stopped.is_set() or self.worker.exitcode is None:
+                continue
+            try:
+                self._restart_writer()
+            except Exception as e:
+                print(f"unitlog restart writer failed: {e}\n "
+                      f"{traceback.format_exc()}", file=sys.stderr)
+                self.stopped.wait(timeout=1)
 
     def register_logger(self, name, level=logging.INFO,
                         console_log=True, file_log=False, file_log_mode="a",
                         log_filepath=None,
                         parent_logger_name=None,
-                        force_all_console_log_to_file=False) -> logging.Logger:
-
-        if not self.started.is_set():
-            self.bus_queue = mp.Queue()
-            self.worker = mp.Process(target=self.listening_log_msg, args=(self.bus_queue, ), daemon=True)
-            self.worker.start()
-            if not self.started.wait(timeout=3):
-                raise ValueError("unit log process is not started")
+                        force_all_console_log_to_file=False,
+                        columnar_log=False, columnar_filepath=None,
+                        columnar_fields=("time_cost", ),
+                        columnar_mode="a",
+                        caller_info=True,
+                        log_path_template=False) -> logging.Logger:
+        """
+        :param log_path_template: 为 True 时 log_filepath 是模板, 例: ./logs/{tenant}/{date}.log,
+                                  由写日志进程根据 record 的 extra 和时间解析出真实路径;
+                                  默认按原样使用, 路径中的 {} 不做解析
+        :param columnar_log: 额外写一份列式文件, 记录时间、级别、logger、函数名以及
+                             columnar_fields 中的数值型 extra, 用 unitlog.columnar.load_columnar 读取
+        :param caller_info: 为 False 时不查找调用者的文件名和行号, 日志格式中也不再包含它们
+        """
+
+        self._ensure_writer()
+        return self._setup_logger(
+            _RegisterCache(), name, level, console_log=console_log,
+            file_log=file_log, file_log_mode=file_log_mode,
+            log_filepath=log_filepath, parent_logger_name=parent_logger_name,
+            force_all_console_log_to_file=force_all_console_log_to_file,
+            columnar_log=columnar_log, columnar_filepath=columnar_filepath,
+            columnar_fields=columnar_fields, columnar_mode=columnar_mode,
+            caller_info=caller_info, log_path_template=log_path_template)
+
+    def configure(self, spec) -> dict:
+        """ 一次注册多个 logger, 全部配置校验通过后才会启动写日志进程;
+            配置相同的 logger 共用同一个 handler, 每个目录只创建一次,
+            每个日志文件只写一次 Log_filename
+
+            unit_log.configure({
+                "app": {"file_log": True, "log_filepath": "./logs/app.log"},
+                "app.db": {"level": "DEBUG", "parent_logger_name": "app"},
+            })
+
+        :param spec: {name: register_logger 的参数} 或 [{"name": name, ...}, ...]
+        :return: {name: logger}
+        """
+        entries = self._validate_spec(spec)
+        self._ensure_writer()
+        cache = _RegisterCache()
+        return {entry["name"]: self._setup_logger(cache, **entry)
+                for entry in entries}
+
+    def _validate_spec(self, spec) -> list:
+        if isinstance(spec, dict):
+            spec = [dict(options or {}, name=name)
+                    for name, options in spec.items()]
+        signature = inspect.signature(self.register_logger)
+        entries = []
+        names = set()
+        file_modes = {}
+        for i, options in enumerate(spec):
+            if not isinstance(options, dict):
+                raise ValueError(f"logger spec #{i} must be a dict, "
+                                 f"got {type(options).__name__}")
+            try:
+                bound = signature.bind(**options)
+            except TypeError as e:
+                raise ValueError(f"logger spec #{i}: {e}")
+            bound.apply_defaults()
+            entry = bound.arguments
+            name = entry["name"]
+            if not isinstance(name, str) or not name:
+                raise ValueError(f"logger spec #{i}: invalid name {name!r}")
+            if name in names:
+                raise ValueError(f"logger {name}: registered more than once")
+            names.add(name)
+            entry["level"] = self._check_level(name, entry["level"])
+
+            if entry["file_log"]:
+                log_filepath = entry["log_filepath"]
+                if not log_filepath:
+                    raise ValueError(f"logger {name}: log_filepath must be set")
+                if entry["file_log_mode"] not in ("a", "w"):
+                    raise ValueError(f"logger {name}: invalid file_log_mode "
+                                     f"{entry['file_log_mode']!r}")
+                is_dynamic = False
+                if entry["log_path_template"]:
+                    try:
+                        is_dynamic = compile_path_template(
+                            log_filepath).is_dynamic
+                    except ValueError as e:
+                        raise ValueError(f"logger {name}: {e}")
+                if entry["force_all_console_log_to_file"] and is_dynamic:
+                    raise ValueError(f"logger {name}: force_all_console_log_"
+                                     f"to_file needs a fixed log_filepath")
+                file_mode = file_modes.setdefault(log_filepath,
+                                                  entry["file_log_mode"])
+                if file_mode != entry["file_log_mode"]:
+                    # 写日志进程只按第一条日志的 mode 打开文件
+                    raise ValueError(f"logger {name}: conflicting "
+                                     f"file_log_mode for {log_filepath}")
+            elif entry["force_all_console_log_to_file"]:
+                raise ValueError(f"logger {name}: force_all_console_log_"
+                                 f"to_file needs file_log")
+            if entry["columnar_log"]:
+                if not entry["columnar_filepath"]:
+                    raise ValueError(f"logger {name}: columnar_filepath "
+                                     f"must be set")
+                if entry["columnar_mode"] not in ("a", "w"):
+                    raise ValueError(f"logger {name}: invalid columnar_mode "
+                                     f"{entry['columnar_mode']!r}")
+                fields = entry["columnar_fields"]
+                if not fields or not all(isinstance(f, str) for f in fields):
+                    raise ValueError(f"logger {name}: columnar_fields must be "
+                                     f"a non-empty list of names")
+            entries.append(entry)
+        return entries
 
-        logger = logging.getLogger(name)
+    @classmethod
+    def _check_level(cls, name, level) -> int:
+        if isinstance(level, str):
+            # noinspection PyProtectedMember,PyUnresolvedReferences
+            levelno = logging._nameToLevel.get(level.upper())
+            if levelno is None:
+                raise ValueError(f"logger {name}: unknown level {level!r}")
+            return levelno
+        if not isinstance(level, int) or isinstance(level, bool):
+            raise ValueError(f"logger {name}: invalid level {level!r}")
+        return level
+
+    def _ensure_writer(self):
+        # fork 出的子进程继承了 worker, 共用父进程的写日志进程
+        if self.worker is None:
+            self.bus_queue = self._new_queue()
+            if self.priority_level is not None:
+                self.priority_queue = self._new_queue()
+            self._start_writer()
+            # 在 multiprocessing 的退出函数 terminate 写日志进程之前停止 watchdog
+            atexit.register(self.stop)
+            if self.mode != MODE_THREAD:
+                self._start_watchdog()
+
+    def _get_formatters(self, caller_info) -> (logging.Formatter,
+                                               logging.Formatter):
+        """ (console formatter, file formatter), 按 caller_info 缓存
+        """
+        formatters = self._formatters.get(caller_info)
+        if formatters is not None:
+            return formatters
+        # 去重模式下同一个异常会被多个 handler 格式化, 只格式化一次
+        cache_exc_text = bool(self.traceback_dedup_window)
+        if caller_info:
+            simple_formatter = UnitFormatter(
+                fmt="%(asctime)s [line:%(lineno)d] %(levelname)s %(message)s",
+                datefmt="%a, %d %b %Y %H:%M:%S",
+                cache_exc_text=cache_exc_text
+            )
+            full_formatter = UnitFormatter(
+                fmt="%(asctime)s %(filename)s [line:%(lineno)d] %(levelname)s "
+                    "%(message)s",
+                datefmt="%a, %d %b %Y %H:%M:%S",
+                cache_exc_text=cache_exc_text
+            )
+        else:
+            simple_formatter = full_formatter = UnitFormatter(
+                fmt="%(asctime)s %(levelname)s %(message)s",
+                datefmt="%a, %d %b %Y %H:%M:%S",
+                cache_exc_text=cache_exc_text
+            )
+        formatters = self._formatters[caller_info] = (simple_formatter,
+                                                      full_formatter)
+        return formatters
+
+    def _get_handler(self, cache, key, factory) -> logging.Handler:
+        handler = cache.handlers.get(key)
+        if handler is None:
+            handler = cache.handlers[key] = factory()
+            self._handlers.add(handler)
+        return handler
+
+    def _makedirs(self, cache, dir_path):
+        if dir_path and dir_path not in cache.dirs:
+            os.makedirs(dir_path, exist_ok=True)
+            cache.dirs.add(dir_path)
+
+    def _setup_logger(self, cache, name, level=logging.INFO,
+                      console_log=True, file_log=False, file_log_mode="a",
+                      log_filepath=None, parent_logger_name=None,
+                      force_all_console_log_to_file=False,
+                      columnar_log=False, columnar_filepath=None,
+                      columnar_fields=("time_cost", ), columnar_mode="a",
+                      caller_info=True,
+                      log_path_template=False) -> logging.Logger:
+        logger = install_unit_logger(logging.getLogger(name),
+                                     caller_info=caller_info)
         logger.setLevel(level)
         if parent_logger_name is not None:
             parent_logger = logging.getLogger(parent_logger_name)
@@ -119,29 +713,64 @@ class UnitLog(object):
         else:
             logger.propagate = False
 
-        simple_formatter = logging.Formatter(
-            fmt="%(asctime)s [line:%(lineno)d] %(levelname)s %(message)s",
-            datefmt="%a, %d %b %Y %H:%M:%S"
-        )
-        full_formatter = logging.Formatter(
-            fmt="%(asctime)s %(filename)s [line:%(lineno)d] %(levelname)s "
-                "%(message)s",
-            datefmt="%a, %d %b %Y %H:%M:%S"
-        )
+        simple_formatter, full_formatter = self._get_formatters(caller_info)
+        dedup_traceback = bool(self.traceback_dedup_window)
         if console_log:
-            console_handler = UnitConsoleHandler(bus_queue=self.bus_queue)
-            console_handler.setFormatter(simple_formatter)
-            logger.handlers.append(console_handler)
+            def _new_console_handler():
+                handler = UnitConsoleHandler(
+                    bus_queue=self.bus_queue,
+                    priority_queue=self.priority_queue,
+                    priority_level=self.priority_level,
+                    dedup_traceback=dedup_traceback)
+                handler.setFormatter(simple_formatter)
+                return handler
+
+            logger.handlers.append(self._get_handler(
+                cache, ("console", caller_info), _new_console_handler))
         if file_log:
             assert log_filepath, "log_filepath must be set"
-            os.makedirs(os.path.dirname(log_filepath), exist_ok=True)
-            file_handler = UnitFileHandler(log_filepath, mode=file_log_mode, bus_queue=self.bus_queue)
-            file_handler.setFormatter(full_formatter)
-            logger.handlers.append(file_handler)
-            logger.info("\nLog_filename: {}".format(log_filepath))
+            is_dynamic = False
+            if log_path_template:
+                path_template = compile_path_template(log_filepath)
+                is_dynamic = path_template.is_dynamic
+                self._makedirs(cache, path_template.static_dir)
+            else:
+                self._makedirs(cache, os.path.dirname(log_filepath))
+
+            def _new_file_handler():
+                handler = UnitFileHandler(
+                    log_filepath, mode=file_log_mode,
+                    bus_queue=self.bus_queue,
+                    priority_queue=self.priority_queue,
+                    priority_level=self.priority_level,
+                    dedup_traceback=dedup_traceback,
+                    log_path_template=log_path_template)
+                handler.setFormatter(full_formatter)
+                return handler
+
+            logger.handlers.append(self._get_handler(
+                cache, ("file", log_filepath, file_log_mode, caller_info,
+                        log_path_template),
+                _new_file_handler))
+            if not is_dynamic and log_filepath not in cache.log_filepaths:
+                cache.log_filepaths.add(log_filepath)
+                logger.info("\nLog_filename: {}".format(log_filepath))
 
             if force_all_console_log_to_file: # 强制控制所有标准输出到 文件
+                assert not is_dynamic, \
+                    "force_all_console_log_to_file needs a fixed log_filepath"
                 self.force_all_console_log_to_file(log_filepath)
+        if columnar_log:
+            assert columnar_filepath, "columnar_filepath must be set"
+            self._makedirs(cache, os.path.dirname(columnar_filepath))
+            logger.handlers.append(self._get_handler(
+                cache, ("columnar", columnar_filepath, tuple(columnar_fields),
+                        columnar_mode),
+                lambda: UnitColumnarHandler(
+                    columnar_filepath, columns=columnar_fields,
+                    mode=columnar_mode, bus_queue=self.bus_queue,
+                    priority_queue=self.priority_queue,
+                    priority_level=self.priority_level)))
 
         return logger
 
@@ -242,10 +871,32 @@ class UnitLog(object):
             sys.stdout = Logger(log_filepath)
             sys.stderr = sys.stdout
 
+
+_UNIT_LOGS = weakref.WeakSet()
+# 解释器开始退出, 先于 multiprocessing 的退出函数执行 (atexit 后注册的先执行)
+_EXITING = threading.Event()
+atexit.register(_EXITING.set)
+
+
+def _run_fork_hook(name):
+    def _hook():
+        for unit_log in list(_UNIT_LOGS):
+            try:
+                getattr(unit_log, name)()
+            except Exception as e:
+                print(f"unitlog {name} failed: {e}\n "
+                      f"{traceback.format_exc()}", file=sys.stderr)
+    return _hook
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_run_fork_hook("_before_fork"),
+                        after_in_parent=_run_fork_hook("_after_fork_in_parent"),
+                        after_in_child=_run_fork_hook("_after_fork_in_child"))
+
 DEFAULT_LOG = UnitLog()
 
 register_logger: UnitLog.register_logger = DEFAULT_LOG.register_logger
-atexit.register(lambda: DEFAULT_LOG.stopped.set())
 
 
 
@@ -38,16 +38,18 @@ def log_func_cost(start, func_obj, desc=None, insert_extra=True,
         return
 
     desc = f"[{desc}]" if desc else ""
-    # 日志统计使用 毫秒
-    extra = {extra_key: cost * 1000} if insert_extra else {}
+    func_name = func_obj.__name__
+    # 日志统计使用 毫秒, func_name 供 columnar 日志区分被统计的函数
+    extra = {extra_key: cost * 1000, "func_name": func_name} \
+        if insert_extra else {}
     # src_filepath, src_lines, line_no = get_source_info(func_obj)
     # line_no += 1
     # src_filename = os.path.basename(src_filepath)
-    func_name = func_obj.__name__
     log_msg = (f"【FUNC TIME COST】: {desc} "
                f"{func_name}(**) cost {get_log_cost_msg(cost)}")
     if log_method in (logging.info, logging.debug, logging.error,
-                      logging.warning):
+                      logging.warning) or isinstance(
+            getattr(log_method, "__self__", None), logging.Logger):
         log_method(log_msg, extra=extra)
     else:
         log_method(log_msg)